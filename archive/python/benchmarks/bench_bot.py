@@ -0,0 +1,238 @@
+"""
+archive/python のBotのハンドラを偽のDiscordオブジェクトで動かすベンチマーク。
+
+  joins      : on_voice_state_update の1件あたりのレイテンシと毎秒処理数
+  on_message : 自己紹介チャンネルへの投稿 (on_message) の1件あたりのレイテンシと毎秒処理数
+  backfill   : on_ready からの起動時スキャン（リース取得・スキャン・インデックス読み込み）の毎秒処理メッセージ数
+  reminder   : send_intro_reminder のサーバー人数ごとの所要時間 (既定 1k/10k/100k)
+
+既定では database.py をメモリ上の偽物 (fakes.FakeDatabase) に差し替える。
+--real-db を付けると BENCH_DATABASE_URL のPostgresを使う。実行のたびに自己紹介・リマインダーの
+テーブルを空にするので、本番の .env の DATABASE_URL は使わず、ローカルのDB以外は受け付けない。
+
+    python benchmarks/bench_bot.py [--joins 2000] [--messages 3000] [--backfill-messages 3000]
+                                   [--reminder-sizes 1000,10000,100000] [--repeat 5]
+                                   [--db-latency-ms 0] [--rest-latency-ms 0] [--real-db]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import database  # noqa: E402
+import main  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeDatabase, FakeGuild, FakeMember, FakeMessage, FakeTextChannel, FakeVoiceChannel, FakeVoiceState,
+)
+from send_queue import close_send_queues  # noqa: E402
+
+# --real-db で空にするテーブル（ベンチマークが書き込むもの）
+BENCH_TABLES = (
+    "introductions", "introduction_messages", "daily_reminder_log", "reminder_recipients",
+    "scheduled_jobs", "job_leases",
+)
+LOCAL_HOSTS = (None, "", "localhost", "127.0.0.1", "::1")
+
+BASE_USER_ID = 10 ** 17
+BASE_MESSAGE_ID = 10 ** 18
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def report(label, samples, unit_count=1, unit="ops"):
+    total = sum(samples)
+    rate = unit_count * len(samples) / total if total else float("inf")
+    print(
+        f"{label:<28} p50 {percentile(samples, 0.5) * 1000:9.3f}ms  "
+        f"p95 {percentile(samples, 0.95) * 1000:9.3f}ms  "
+        f"p99 {percentile(samples, 0.99) * 1000:9.3f}ms  "
+        f"{rate:12.1f} {unit}/s"
+    )
+
+class World:
+    """
+    サーバー・チャンネル・メンバー・自己紹介メッセージの一式を作り、main.bot から見えるようにする。
+    """
+
+    def __init__(self, member_count, intro_ratio=0.5, rest_latency=0.0):
+        self.route = main.routing.routes[0]
+        self.guild = FakeGuild(1)
+        self.intro_channel = FakeTextChannel(self.route.intro_channel_id, self.guild, "自己紹介", rest_latency)
+        self.notify_channel = FakeTextChannel(self.route.notify_channel_id, self.guild, "通知", rest_latency)
+        self.voice_channel = FakeVoiceChannel(min(self.route.voice_channel_ids), self.guild, "雑談")
+
+        introduced = int(member_count * intro_ratio)
+        for i in range(member_count):
+            member = FakeMember(BASE_USER_ID + i, nick=f"メンバー{i}" if i % 2 == 0 else None)
+            self.guild.add_member(member)
+            if i < introduced:
+                self.intro_channel.messages.append(
+                    FakeMessage(BASE_MESSAGE_ID + i, member, self.intro_channel, f"はじめまして、{i}番です。" * 5)
+                )
+
+        channels = {c.id: c for c in (self.intro_channel, self.notify_channel, self.voice_channel)}
+        main.bot.get_channel = channels.get
+        main.bot.get_guild = {self.guild.id: self.guild}.get
+
+def reset_bot_state():
+    close_send_queues()
+    main.intro_index.loaded = False
+    main.intro_index._entries = {}
+    main.intro_message_cache._cache.clear()
+    main.display_name_cache.clear()
+    main.join_debouncer.cooldown_seconds = 0
+
+async def bench_joins(fake_db, args):
+    world = World(max(args.joins, 100), intro_ratio=0.8, rest_latency=args.rest_latency)
+    main.BACKFILL_HISTORY_LIMIT = None
+    reset_bot_state()
+    if fake_db:
+        fake_db.reset()
+    await main.backfill_introductions(world.intro_channel)
+    await main.intro_index.load()
+
+    before = FakeVoiceState(None)
+    after = FakeVoiceState(world.voice_channel)
+    members = world.guild.members[:args.joins]
+
+    for label in ("joins (cold cache)", "joins (warm cache)"):
+        samples = []
+        for member in members:
+            start = time.perf_counter()
+            await main.on_voice_state_update(member, before, after)
+            samples.append(time.perf_counter() - start)
+        report(label, samples, unit="joins")
+    close_send_queues()
+
+async def bench_on_message(fake_db, args):
+    world = World(args.messages, intro_ratio=1.0)
+    reset_bot_state()
+    if fake_db:
+        fake_db.reset()
+    else:
+        await reset_real_db()
+    await main.intro_index.load()
+
+    samples = []
+    for message in world.intro_channel.messages:
+        start = time.perf_counter()
+        await main.on_message(message)
+        samples.append(time.perf_counter() - start)
+    report("on_message (intro)", samples, unit="msgs")
+    if len(main.intro_index) != len(world.intro_channel.messages):
+        print(f"  ⚠️ インデックスの件数が一致しません ({len(main.intro_index)}/{len(world.intro_channel.messages)})")
+
+async def bench_backfill(fake_db, args):
+    world = World(args.backfill_messages, intro_ratio=1.0)
+    main.BACKFILL_HISTORY_LIMIT = args.backfill_messages
+    # on_ready から日次リマインダーの取りこぼし分を送らせない
+    main.daily_reminder_caught_up = True
+    samples = []
+    for _ in range(args.repeat):
+        reset_bot_state()
+        if fake_db:
+            fake_db.reset()
+        else:
+            await reset_real_db()
+        start = time.perf_counter()
+        await main.on_ready()
+        samples.append(time.perf_counter() - start)
+        main.scheduler.stop()
+        if len(main.intro_index) != args.backfill_messages:
+            print(f"  ⚠️ スキャン後のインデックスの件数が一致しません ({len(main.intro_index)}/{args.backfill_messages})")
+    report(f"backfill ({args.backfill_messages} msgs)", samples, unit_count=args.backfill_messages, unit="msgs")
+
+async def bench_reminder(fake_db, args):
+    for size in args.reminder_sizes:
+        world = World(size, intro_ratio=0.5)
+        main.BACKFILL_HISTORY_LIMIT = None
+        reset_bot_state()
+        if fake_db:
+            fake_db.reset()
+        await main.backfill_introductions(world.intro_channel)
+        await main.intro_index.load()
+        samples = []
+        for _ in range(args.repeat):
+            close_send_queues()
+            start = time.perf_counter()
+            result = await main.send_intro_reminder(world.route, force=True)
+            samples.append(time.perf_counter() - start)
+        if not result.startswith("✅"):
+            print(f"  ⚠️ {result}")
+        report(f"reminder ({size} members)", samples, unit="runs")
+    close_send_queues()
+
+def bench_database_url():
+    """
+    --real-db で使う接続先。BENCH_DATABASE_URL がローカルのDBを指していなければ終了する。
+    """
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("❌ --real-db には BENCH_DATABASE_URL（ローカルのベンチマーク用DB）を設定してください")
+    host = urlparse(url).hostname
+    if host not in LOCAL_HOSTS:
+        sys.exit(f"❌ BENCH_DATABASE_URL のホスト {host} はローカルではありません（テーブルを空にするため拒否します）")
+    return url
+
+async def reset_real_db():
+    await database.repo.execute(f"TRUNCATE {', '.join(BENCH_TABLES)}")
+    await database.repo.execute("DELETE FROM settings WHERE key LIKE 'intro_scan_cursor:%'")
+
+async def run(args):
+    fake_db = None
+    if args.real_db:
+        # main の import で読み込まれた .env の DATABASE_URL は使わない
+        database.DATABASE_URL = os.environ["DATABASE_URL"] = bench_database_url()
+        await database.init_intro_bot_db()
+        await database.init_daily_reminder_db()
+        await reset_real_db()
+    else:
+        fake_db = FakeDatabase(latency=args.db_latency)
+        fake_db.install(database)
+        # on_ready は DATABASE_URL が未設定だと何もしないので、偽DBでも値だけは入れておく
+        os.environ.setdefault("DATABASE_URL", "postgresql://fake-database/bench")
+
+    if "joins" in args.only:
+        await bench_joins(fake_db, args)
+    if "on_message" in args.only:
+        await bench_on_message(fake_db, args)
+    if "backfill" in args.only:
+        await bench_backfill(fake_db, args)
+    if "reminder" in args.only:
+        await bench_reminder(fake_db, args)
+
+    if args.real_db:
+        await reset_real_db()
+        await database.close_pool()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--joins", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--backfill-messages", type=int, default=3000)
+    parser.add_argument("--reminder-sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="偽DBの1往復あたりの遅延")
+    parser.add_argument("--rest-latency-ms", type=float, default=0.0, help="偽チャンネルの送信・取得の遅延")
+    parser.add_argument("--only", default="joins,on_message,backfill,reminder")
+    parser.add_argument("--real-db", action="store_true", help="BENCH_DATABASE_URL のローカルのPostgresを使う")
+    args = parser.parse_args()
+    args.reminder_sizes = [int(s) for s in args.reminder_sizes.split(",") if s]
+    args.db_latency = args.db_latency_ms / 1000
+    args.rest_latency = args.rest_latency_ms / 1000
+    args.only = set(args.only.split(","))
+    return args
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,88 @@
+"""
+database.py の1クエリあたりのPython側オーバーヘッドを比較するマイクロベンチマーク。
+
+  before: async with acquire() → connection.fetchval()（従来の書き方）
+  after:  repo.fetchval()
+
+どちらも接続を1回借り、貸し出し待ちを db.pool_acquire として記録する。
+after は asynccontextmanager のジェネレーターを経由しない分だけ軽い。
+既定では何もしない偽のプールを使い、Python側の呼び出しコストだけを測る。
+DATABASE_URL を設定して --real を付けると、実際のPostgresに対して測定する。
+
+    python benchmarks/bench_db_overhead.py [--iterations 20000] [--real]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import database as db  # noqa: E402
+
+class _FakeConnection:
+    async def fetchval(self, query, *args):
+        return 1
+
+class _FakeAcquire:
+    def __init__(self, connection):
+        self._connection = connection
+
+    async def __aenter__(self):
+        return self._connection
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakePool:
+    """asyncpg.Pool のうちベンチマークで使う部分だけを真似た、待ち時間ゼロのプール。"""
+
+    _closed = False
+
+    def __init__(self):
+        self._connection = _FakeConnection()
+
+    def acquire(self):
+        return _FakeAcquire(self._connection)
+
+async def before(query):
+    async with db.acquire() as connection:
+        return await connection.fetchval(query)
+
+async def after(query):
+    return await db.repo.fetchval(query)
+
+async def measure(label, func, iterations, query):
+    for _ in range(min(1000, iterations)):
+        await func(query)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func(query)
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / iterations * 1_000_000
+    print(f"{label:>8}: {per_call_us:8.2f} µs/call ({iterations} calls, {elapsed:.3f}s)")
+    return per_call_us
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--real", action="store_true", help="DATABASE_URL のPostgresに対して測定する")
+    args = parser.parse_args()
+
+    if args.real:
+        await db.get_pool()
+    else:
+        db._pool = FakePool()
+        db.repo.pool = db._pool
+
+    query = "SELECT 1"
+    before_us = await measure("before", before, args.iterations, query)
+    after_us = await measure("after", after, args.iterations, query)
+    print(f"差分: {before_us - after_us:+.2f} µs/call ({(1 - after_us / before_us) * 100:+.1f}% 削減)")
+
+    if args.real:
+        await db.close_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
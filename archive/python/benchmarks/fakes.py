@@ -0,0 +1,281 @@
+"""
+ベンチマーク用に py-cord のオブジェクトと database.py を置き換える偽物。
+Discord にも Postgres にも接続せずに main.py のハンドラを動かすために使う。
+"""
+import asyncio
+import datetime
+
+class FakeAsset:
+    def __init__(self, url):
+        self.url = url
+
+class FakeMember:
+    def __init__(self, member_id, guild=None, name=None, nick=None, bot=False):
+        self.id = member_id
+        self.guild = guild
+        self.bot = bot
+        self.name = name or f"user{member_id}"
+        self.nick = nick
+        self.global_name = None
+        self.display_name = nick or self.name
+        self.display_avatar = FakeAsset(f"https://cdn.example.invalid/avatars/{member_id}.png")
+
+class FakeMessage:
+    def __init__(self, message_id, author, channel, content):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.jump_url = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}"
+
+class FakeVoiceChannel:
+    def __init__(self, channel_id, guild, name="VC"):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+
+class FakeVoiceState:
+    def __init__(self, channel=None):
+        self.channel = channel
+
+class FakeTextChannel:
+    """
+    履歴の読み込み・メッセージ取得・送信だけを持つテキストチャンネル。
+    send/fetch_message に遅延を入れて REST 呼び出しを模擬できる。
+    """
+
+    def __init__(self, channel_id, guild, name="channel", rest_latency=0.0):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+        self.rest_latency = rest_latency
+        self.messages = []
+        self.sent = []
+
+    async def history(self, limit=100, after=None, oldest_first=None):
+        messages = self.messages
+        if after is not None:
+            messages = [m for m in messages if m.id > after.id]
+            if oldest_first is None:
+                oldest_first = True
+        ordered = messages if oldest_first else list(reversed(messages))
+        if limit is not None:
+            ordered = ordered[:limit]
+        for message in ordered:
+            yield message
+
+    async def fetch_message(self, message_id):
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        raise LookupError(message_id)
+
+    async def send(self, content=None, **kwargs):
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+        self.sent.append((content, kwargs))
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.shard_id = 0
+        self.members = []
+        self._members_by_id = {}
+
+    def add_member(self, member):
+        member.guild = self
+        self.members.append(member)
+        self._members_by_id[member.id] = member
+
+    def get_member(self, member_id):
+        return self._members_by_id.get(member_id)
+
+    async def fetch_member(self, member_id):
+        return self._members_by_id[member_id]
+
+    async def query_members(self, user_ids=None, limit=5, cache=True, **kwargs):
+        return [self._members_by_id[i] for i in user_ids or [] if i in self._members_by_id]
+
+class FakeDatabase:
+    """
+    main.py が使う database.py の関数をメモリ上で再現する。
+    latency を指定すると、各呼び出しに往復時間を模擬した待ちを入れる。
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.reset()
+
+    def reset(self):
+        self.introductions = {}
+        self.intro_messages = {}
+        self.snapshots = {}
+        self.settings = {}
+        self.reminder_log = {}
+        self.reminder_recipients = {}
+        self.job_leases = {}
+        self.scheduled_jobs = {}
+
+    async def _roundtrip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def install(self, module):
+        """
+        database モジュールの関数をこのオブジェクトのメソッドに差し替える。
+        """
+        for name in (
+            "init_intro_bot_db", "init_daily_reminder_db", "get_intro_count", "list_recent_intros",
+            "save_intro", "save_intros_bulk", "get_intro_ids", "get_all_intro_ids",
+            "mark_intro_message_edited", "delete_intro_messages", "get_intro_snapshot", "save_intro_snapshot",
+            "get_intro_scan_cursor", "set_intro_scan_cursor",
+            "check_daily_reminder_sent", "log_daily_reminder", "sync_reminder_recipients",
+            "try_acquire_job_lease", "release_job_lease", "get_job_next_run", "set_job_next_run", "close_pool",
+        ):
+            setattr(module, name, getattr(self, name))
+
+    async def init_intro_bot_db(self):
+        await self._roundtrip()
+
+    async def init_daily_reminder_db(self):
+        await self._roundtrip()
+
+    async def close_pool(self):
+        pass
+
+    async def get_intro_count(self):
+        await self._roundtrip()
+        return len(self.introductions)
+
+    async def list_recent_intros(self, limit=10):
+        await self._roundtrip()
+        rows = sorted(self.introductions.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {"user_id": user_id, "channel_id": channel_id, "message_id": message_id, "created_at": None}
+            for (channel_id, user_id), message_id in rows
+        ]
+
+    async def save_intro(self, user_id, channel_id, message_id, content=None, jump_url=None):
+        await self._roundtrip()
+        self.snapshots[message_id] = (content, jump_url)
+        inserted = (channel_id, user_id) not in self.introductions
+        self.intro_messages.setdefault(message_id, (user_id, channel_id))
+        self.introductions[(channel_id, user_id)] = message_id
+        return inserted
+
+    async def save_intros_bulk(self, rows):
+        await self._roundtrip()
+        inserted = updated = 0
+        for user_id, channel_id, message_id, content, jump_url in rows:
+            self.intro_messages.setdefault(message_id, (user_id, channel_id))
+            self.snapshots[message_id] = (content, jump_url)
+            current = self.introductions.get((channel_id, user_id))
+            if current is None:
+                inserted += 1
+            elif current < message_id:
+                updated += 1
+            else:
+                continue
+            self.introductions[(channel_id, user_id)] = message_id
+        return inserted, updated
+
+    async def mark_intro_message_edited(self, message_id, content=None):
+        await self._roundtrip()
+        if content is not None and message_id in self.snapshots:
+            _, jump_url = self.snapshots[message_id]
+            self.snapshots[message_id] = (content, jump_url)
+        return message_id in self.intro_messages
+
+    async def get_intro_snapshot(self, user_id, channel_id):
+        await self._roundtrip()
+        message_id = self.introductions.get((channel_id, user_id))
+        if message_id is None:
+            return None
+        content, jump_url = self.snapshots.get(message_id, (None, None))
+        return {
+            "channel_id": channel_id, "message_id": message_id,
+            "content": content, "jump_url": jump_url,
+        }
+
+    async def save_intro_snapshot(self, user_id, channel_id, message_id, content, jump_url):
+        await self._roundtrip()
+        self.snapshots[message_id] = (content, jump_url)
+
+    async def delete_intro_messages(self, message_ids):
+        await self._roundtrip()
+        deleted = set(message_ids)
+        for message_id in deleted:
+            self.intro_messages.pop(message_id, None)
+            self.snapshots.pop(message_id, None)
+        changes = {}
+        for key, message_id in list(self.introductions.items()):
+            if message_id not in deleted:
+                continue
+            channel_id, user_id = key
+            remaining = [m for m, entry in self.intro_messages.items() if entry == (user_id, channel_id)]
+            if remaining:
+                self.introductions[key] = changes[key] = max(remaining)
+            else:
+                del self.introductions[key]
+                changes[key] = None
+        return changes
+
+    async def get_intro_ids(self, user_id, channel_id):
+        await self._roundtrip()
+        message_id = self.introductions.get((channel_id, user_id))
+        return {"channel_id": channel_id, "message_id": message_id} if message_id else None
+
+    async def get_all_intro_ids(self):
+        await self._roundtrip()
+        return [
+            {"user_id": user_id, "channel_id": channel_id, "message_id": message_id}
+            for (channel_id, user_id), message_id in self.introductions.items()
+        ]
+
+    async def get_intro_scan_cursor(self, channel_id):
+        await self._roundtrip()
+        return self.settings.get(f"intro_scan_cursor:{channel_id}")
+
+    async def set_intro_scan_cursor(self, channel_id, message_id):
+        await self._roundtrip()
+        self.settings[f"intro_scan_cursor:{channel_id}"] = message_id
+
+    async def check_daily_reminder_sent(self, date=None, guild_id=0):
+        await self._roundtrip()
+        return (guild_id, date or datetime.date.today()) in self.reminder_log
+
+    async def sync_reminder_recipients(self, user_ids, guild_id=0):
+        await self._roundtrip()
+        current = set(user_ids)
+        recipients = self.reminder_recipients.setdefault(guild_id, set())
+        recipients &= current
+        return [user_id for user_id in user_ids if user_id not in recipients]
+
+    async def log_daily_reminder(self, notified_count, new_user_ids=(), date=None, guild_id=0):
+        await self._roundtrip()
+        self.reminder_log.setdefault((guild_id, date or datetime.date.today()), notified_count)
+        self.reminder_recipients.setdefault(guild_id, set()).update(new_user_ids)
+
+    async def try_acquire_job_lease(self, name, guild_id, holder, ttl_seconds):
+        await self._roundtrip()
+        current = self.job_leases.get((name, guild_id))
+        if current is not None and current != holder:
+            return False
+        self.job_leases[(name, guild_id)] = holder
+        return True
+
+    async def get_job_next_run(self, name):
+        await self._roundtrip()
+        return self.scheduled_jobs.get(name)
+
+    async def set_job_next_run(self, name, next_run_at, last_run_at=None):
+        await self._roundtrip()
+        self.scheduled_jobs[name] = next_run_at
+
+    async def release_job_lease(self, name, guild_id, holder):
+        await self._roundtrip()
+        if self.job_leases.get((name, guild_id)) == holder:
+            del self.job_leases[(name, guild_id)]
@@ -0,0 +1,150 @@
+import bisect
+import logging
+import os
+from collections import Counter
+import database as db
+from metrics import timed
+from write_behind import WriteBehindState
+
+class BumpCounter(WriteBehindState):
+    """
+    user_id -> BUMP数 のメモリ内カウンター。
+    BUMPはメモリ上で即座に数え、DBへは flush で増分をまとめて書き込む（ライトビハインド）。
+    上位 top_k 人のランキングと合計もメモリ上で保持し、読み取りでDBに問い合わせない。
+    増分を加算する形で書き込むので、複数プロセスから書いてもDB上の件数は正しくなる
+    （ただし他のプロセスの増分は再読み込みまでこのプロセスのランキングに反映されない）。
+    DBとのやり取りは load_counts（全ユーザーのBUMP数を返す）と add_counts（(user_id, 増分) のリストを加算する）で行う。
+    flush_delay_seconds を指定すると、BUMPを数えてからその秒数後に自動で flush する。
+    """
+
+    label = "BUMP数"
+
+    def __init__(self, load_counts, add_counts, top_k=25, flush_delay_seconds=None):
+        super().__init__(flush_delay_seconds)
+        self._load_counts = load_counts
+        self._add_counts = add_counts
+        self.top_k = top_k
+        self._counts = {}
+        self._pending = Counter()
+        self._total = 0
+        # (-BUMP数, user_id) の昇順リスト。先頭ほど上位
+        self._top = []
+        self._top_users = set()
+
+    async def load(self):
+        """
+        DBから全ユーザーのBUMP数を読み込み、ランキングと合計を作り直す。
+        未反映の増分は読み込んだ値に上乗せする。
+        """
+        records = await self._load_counts()
+        counts = {record['user_id']: record['bump_count'] for record in records}
+        for user_id, delta in self._pending.items():
+            counts[user_id] = counts.get(user_id, 0) + delta
+        self._counts = counts
+        self._total = sum(counts.values())
+        self._top = sorted((-count, user_id) for user_id, count in counts.items())[:self.top_k]
+        self._top_users = {user_id for _, user_id in self._top}
+        self.loaded = True
+        logging.info(f"🏆 BUMP数を読み込みました ({len(counts)}人, 合計 {self._total}回)")
+
+    async def record(self, user_id):
+        """
+        BUMPを1回数え、そのユーザーの新しいBUMP数を返す。DBへの書き込みは次の flush で行う。
+        """
+        await self.ensure_loaded()
+        count = self._counts.get(user_id, 0) + 1
+        self._counts[user_id] = count
+        self._pending[user_id] += 1
+        self._total += 1
+        self._update_top(user_id, count)
+        self._schedule_flush()
+        return count
+
+    def _update_top(self, user_id, count):
+        # BUMP数は増えるだけなので、ランキング外から入りうるのは今回増えたユーザーだけ
+        top = self._top
+        key = (-count, user_id)
+        if user_id in self._top_users:
+            del top[bisect.bisect_left(top, (-(count - 1), user_id))]
+        elif len(top) >= self.top_k and key >= top[-1]:
+            return
+        bisect.insort(top, key)
+        self._top_users.add(user_id)
+        if len(top) > self.top_k:
+            _, dropped_user = top.pop()
+            self._top_users.discard(dropped_user)
+
+    async def get_count(self, user_id):
+        await self.ensure_loaded()
+        return self._counts.get(user_id, 0)
+
+    async def get_top_users(self, limit=5):
+        """
+        BUMP数の多い順に (user_id, BUMP数) のリストを返す。
+        """
+        await self.ensure_loaded()
+        if limit <= self.top_k:
+            return [(user_id, -negative) for negative, user_id in self._top[:limit]]
+        ranked = sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    async def get_total(self):
+        await self.ensure_loaded()
+        return self._total
+
+    def _take_pending(self):
+        pending, self._pending = self._pending, Counter()
+        return pending
+
+    def _restore_pending(self, pending):
+        self._pending.update(pending)
+
+    async def _write(self, pending):
+        await self._add_counts(list(pending.items()))
+        return len(pending)
+
+    def stats(self):
+        return {
+            "users": len(self._counts),
+            "total": self._total,
+            "pending_users": len(self._pending),
+            "pending_bumps": sum(self._pending.values()),
+            "flushed_batches": self.flushed_batches,
+            "flush_failures": self.flush_failures,
+        }
+
+# BUMPくんのBUMP数。BUMPくんは database の関数ではなく、下の関数から読み書きする。
+# 数えるのはメモリ上だけで、増分は BUMP_FLUSH_INTERVAL_SECONDS 秒ごとにまとめてDBへ書き込む。
+# 未反映の増分は database.close_pool() で接続プールを閉じる前にも書き込まれる
+BUMP_FLUSH_INTERVAL_SECONDS = int(os.getenv("BUMP_FLUSH_INTERVAL_SECONDS", "30"))
+BUMP_LEADERBOARD_SIZE = 25
+bump_counter = BumpCounter(
+    db.get_all_bump_counts, db.add_bump_counts,
+    top_k=BUMP_LEADERBOARD_SIZE, flush_delay_seconds=BUMP_FLUSH_INTERVAL_SECONDS
+)
+db.register_pending_flush(bump_counter.flush)
+
+@timed("bump.record_bump")
+async def record_bump(user_id):
+    """
+    BUMPを1回数え、そのユーザーの新しいBUMP数を返す。
+    """
+    return await bump_counter.record(user_id)
+
+@timed("bump.get_top_users")
+async def get_top_users(limit=5):
+    """
+    BUMP数の多い順に user_id・bump_count を持つ行のリストを返す（以前の database.get_top_users と同じ形）。
+    """
+    return [
+        {'user_id': user_id, 'bump_count': count}
+        for user_id, count in await bump_counter.get_top_users(limit)
+    ]
+
+@timed("bump.get_user_count")
+async def get_user_count(user_id):
+    return await bump_counter.get_count(user_id)
+
+@timed("bump.get_total_bumps")
+async def get_total_bumps():
+    return await bump_counter.get_total()
@@ -0,0 +1,154 @@
+import datetime
+import heapq
+import logging
+import os
+import time
+import database as db
+from metrics import timed
+from write_behind import WriteBehindState
+
+class CooldownManager(WriteBehindState):
+    """
+    (user_id, guild_id, rule) ごとのトークンバケットによるクールダウン・レート制限。
+    判定はメモリ上だけで行い、DBへは flush でまとめて保存する（再起動をまたいで状態を残すためだけ）。
+    DBとのやり取りは load_buckets（期限切れでないバケットを返す）と save_buckets（バケットの行を保存する）で行う。
+    上限は set_limit でサーバーごと・ルールごとに変えられる。
+    満タンに戻ったバケットはヒープで期限順に取り出して掃除する。
+    flush_delay_seconds を指定すると、トークンを使ってからその秒数後に自動で flush する。
+    """
+
+    label = "クールダウン"
+
+    def __init__(self, load_buckets, save_buckets, default_capacity=1, default_period_seconds=60,
+                 flush_delay_seconds=None):
+        super().__init__(flush_delay_seconds)
+        self._load_buckets = load_buckets
+        self._save_buckets = save_buckets
+        # (guild_id or None, rule or None) -> (容量, 容量分が回復するまでの秒数)
+        self._limits = {(None, None): (default_capacity, default_period_seconds)}
+        # (user_id, guild_id, rule) -> (トークン数, 更新時刻, 満タンになる時刻)
+        self._buckets = {}
+        self._expiry_heap = []
+        self._dirty = set()
+        self.allowed = 0
+        self.limited = 0
+
+    def set_limit(self, capacity, period_seconds, guild_id=None, rule=None):
+        """
+        period_seconds 秒あたり capacity 回までに制限する。
+        guild_id・rule を省略した設定は、より具体的な設定がない場合に使われる。
+        """
+        self._limits[(guild_id, rule)] = (capacity, period_seconds)
+
+    def limit_for(self, guild_id, rule):
+        limits = self._limits
+        return (limits.get((guild_id, rule)) or limits.get((None, rule))
+                or limits.get((guild_id, None)) or limits[(None, None)])
+
+    async def load(self):
+        """
+        DBに保存された、まだ期限切れになっていないバケットを読み込む。
+        """
+        records = await self._load_buckets()
+        for record in records:
+            key = (record['user_id'], record['guild_id'], record['rule'])
+            if key in self._buckets:
+                continue
+            full_at = record['expires_at'].timestamp()
+            self._buckets[key] = (record['tokens'], record['last_report_at'].timestamp(), full_at)
+            heapq.heappush(self._expiry_heap, (full_at, key))
+        self.loaded = True
+        logging.info(f"⏱️ クールダウンを読み込みました ({len(records)}件)")
+
+    async def check(self, user_id, guild_id=0, rule="report", now=None):
+        """
+        トークンを1つ使えれば使って 0 を返す。
+        使えなければトークンは減らさず、次に使えるようになるまでの秒数を返す。
+        """
+        await self.ensure_loaded()
+        remaining = self.try_consume(user_id, guild_id, rule, now)
+        if remaining == 0:
+            self._schedule_flush()
+        return remaining
+
+    def try_consume(self, user_id, guild_id=0, rule="report", now=None):
+        capacity, period_seconds = self.limit_for(guild_id, rule)
+        rate = capacity / period_seconds
+        now = time.time() if now is None else now
+        self._expire(now)
+
+        key = (user_id, guild_id, rule)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+        if tokens < 1:
+            self.limited += 1
+            return (1 - tokens) / rate
+
+        tokens -= 1
+        full_at = now + (capacity - tokens) / rate
+        self._buckets[key] = (tokens, now, full_at)
+        heapq.heappush(self._expiry_heap, (full_at, key))
+        self._dirty.add(key)
+        self.allowed += 1
+        return 0
+
+    def _expire(self, now):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            full_at, key = heapq.heappop(heap)
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket[2] == full_at:
+                del self._buckets[key]
+                self._dirty.discard(key)
+
+    def _take_pending(self):
+        self._expire(time.time())
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def _restore_pending(self, pending):
+        self._dirty |= pending
+
+    async def _write(self, pending):
+        rows = []
+        for key in pending:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            tokens, updated_at, full_at = bucket
+            rows.append((*key, tokens, _to_datetime(updated_at), _to_datetime(full_at)))
+        # 期限切れのバケットの削除も兼ねるので、行がなくても書き込む
+        await self._save_buckets(rows)
+        return len(rows)
+
+    def stats(self):
+        return {
+            "tracked": len(self._buckets),
+            "dirty": len(self._dirty),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+def _to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+# 通報のクールダウン。守護神ボットは database ではなく、下の check_cooldown から判定する。
+# 判定はメモリ上だけで行い、状態は COOLDOWN_FLUSH_INTERVAL_SECONDS 秒ごとにまとめてDBへ保存する。
+# 未保存の状態は database.close_pool() で接続プールを閉じる前にも保存される
+COOLDOWN_FLUSH_INTERVAL_SECONDS = int(os.getenv("COOLDOWN_FLUSH_INTERVAL_SECONDS", "60"))
+report_cooldowns = CooldownManager(
+    db.load_report_cooldowns, db.save_report_cooldowns, flush_delay_seconds=COOLDOWN_FLUSH_INTERVAL_SECONDS
+)
+db.register_pending_flush(report_cooldowns.flush)
+
+@timed("cooldown.check_cooldown")
+async def check_cooldown(user_id, cooldown_seconds, guild_id=0):
+    """
+    通報のクールダウンを判定する。クールダウン中なら残り秒数、そうでなければ 0 を返す。
+    """
+    report_cooldowns.set_limit(1, cooldown_seconds, rule="report")
+    return await report_cooldowns.check(user_id, guild_id, "report")
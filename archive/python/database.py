@@ -2,11 +2,71 @@ import os
 import asyncpg
 import datetime
 import logging
+import time
+from contextlib import asynccontextmanager
+from metrics import observe_latency, timed
+from migrations import migrate
 
 # データベース接続URLを環境変数から取得
 DATABASE_URL = os.environ.get('DATABASE_URL')
 # データベース接続プールをグローバル変数として保持
 _pool = None
+# close_pool の前に呼ぶ、未保存の書き込みを反映する関数（register_pending_flush で登録する）
+_pending_flushes = []
+
+# 接続プールの設定（環境変数で調整できる）
+# DB_POOL_MODE=pgbouncer（既定）: pgbouncerなどのコネクションプーラー経由。ステートメントキャッシュを無効にする。
+# DB_POOL_MODE=direct: Postgresへ直接接続。ステートメントキャッシュを有効にし、よく使うクエリを接続ごとに準備しておく。
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'pgbouncer').lower()
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_COMMAND_TIMEOUT = float(os.environ.get('DB_COMMAND_TIMEOUT', 30))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+
+# 頻繁に実行されるクエリ（direct モードでは接続ごとに事前準備する）
+GET_INTRO_IDS_SQL = "SELECT channel_id, message_id FROM introductions WHERE channel_id = $2 AND user_id = $1"
+GET_INTRO_SNAPSHOT_SQL = (
+    "SELECT channel_id, message_id, content, jump_url FROM introductions WHERE channel_id = $2 AND user_id = $1"
+)
+SAVE_INTRO_SQL = '''
+    WITH logged AS (
+        INSERT INTO introduction_messages (message_id, user_id, channel_id, content, jump_url)
+        VALUES ($3, $1, $2, $4, $5)
+        ON CONFLICT (message_id) DO NOTHING
+    )
+    INSERT INTO introductions (user_id, channel_id, message_id, created_at, content, jump_url) 
+    VALUES ($1, $2, $3, CURRENT_TIMESTAMP, $4, $5)
+    ON CONFLICT (channel_id, user_id) DO UPDATE SET 
+        message_id = EXCLUDED.message_id, 
+        created_at = EXCLUDED.created_at,
+        content = EXCLUDED.content,
+        jump_url = EXCLUDED.jump_url
+    RETURNING (xmax = 0) AS inserted;
+'''
+# レポートのステータスごとの件数を増減させる（$2 のステータスそれぞれに $3 の増分を加える）
+ADJUST_REPORT_STATUS_COUNTS_SQL = '''
+    INSERT INTO report_status_counts (guild_id, status, count)
+    SELECT $1, status, delta FROM unnest($2::text[], $3::bigint[]) AS t(status, delta)
+    ON CONFLICT (guild_id, status) DO UPDATE SET count = report_status_counts.count + EXCLUDED.count;
+'''
+CHECK_DAILY_REMINDER_SQL = (
+    "SELECT id FROM daily_reminder_log WHERE reminder_date = $1 AND (guild_id IS NULL OR guild_id = $2)"
+)
+
+async def _prepare_hot_queries(connection):
+    """
+    新しい接続ごとに呼ばれる init フック。よく使う読み取りクエリを一度実行して
+    ステートメントキャッシュに載せておく（prepare() はキャッシュに載らないので実行する）。
+    書き込みのクエリは初回実行時に自動でキャッシュされるので、ここでは実行しない。
+    """
+    try:
+        await connection.fetchrow(GET_INTRO_IDS_SQL, 0, 0)
+        await connection.fetchrow(GET_INTRO_SNAPSHOT_SQL, 0, 0)
+        await connection.fetchrow(CHECK_DAILY_REMINDER_SQL, datetime.date.today(), 0)
+    except asyncpg.PostgresError as e:
+        # プールは on_ready のマイグレーションより先に作られるので、テーブルやカラムが
+        # まだない場合などがある。準備に失敗しても接続プールの作成は止めない
+        logging.debug("クエリの事前準備をスキップしました: %s", e)
 
 async def get_pool():
     """
@@ -18,422 +78,689 @@ async def get_pool():
         if not DATABASE_URL:
             raise ValueError("DATABASE_URL environment variable is not set.")
         
-        # pgbouncerなどのコネクションプーラーと互換性を持たせるため、
-        # statement_cache_size=0 を設定する。
-        _pool = await asyncpg.create_pool(
-            DATABASE_URL,
-            min_size=1,
-            max_size=10,
-            command_timeout=30,
-            statement_cache_size=0  # pgbouncer互換性のため追加
-        )
-        logging.info("✅ 新しいデータベース接続プールを作成しました (pgbouncer対応)")
+        if DB_POOL_MODE == 'direct':
+            _pool = await asyncpg.create_pool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                init=_prepare_hot_queries
+            )
+            logging.info(f"✅ 新しいデータベース接続プールを作成しました (direct, {DB_POOL_MIN_SIZE}〜{DB_POOL_MAX_SIZE}接続)")
+        else:
+            # pgbouncerなどのコネクションプーラーと互換性を持たせるため、
+            # statement_cache_size=0 を設定する。
+            _pool = await asyncpg.create_pool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                statement_cache_size=0  # pgbouncer互換性のため追加
+            )
+            logging.info(f"✅ 新しいデータベース接続プールを作成しました (pgbouncer対応, {DB_POOL_MIN_SIZE}〜{DB_POOL_MAX_SIZE}接続)")
+        repo.pool = _pool
     return _pool
 
+async def warm_up_pool():
+    """
+    起動時にプールを作成し、min_size 分の接続を確立しておく。
+    """
+    pool = await get_pool()
+    stats = get_pool_stats()
+    logging.info(f"🔥 DB接続プールを準備しました ({stats['size']}接続)")
+    return pool
+
+class Repository:
+    """
+    接続プールを保持するデータアクセス層。
+    1文で済むクエリ用に、acquire() と同じく接続の貸し出し待ちを db.pool_acquire として記録しつつ、
+    asynccontextmanager を経由せずに接続を借りて実行する。
+    プールは get_pool() が作成・差し替えのたびに pool 属性へ設定する。
+    """
+
+    __slots__ = ("pool",)
+
+    def __init__(self):
+        self.pool = None
+
+    async def fetchval(self, query, *args):
+        pool = self.pool or await get_pool()
+        start = time.perf_counter()
+        async with pool.acquire() as connection:
+            observe_latency("db.pool_acquire", time.perf_counter() - start)
+            return await connection.fetchval(query, *args)
+
+    async def fetchrow(self, query, *args):
+        pool = self.pool or await get_pool()
+        start = time.perf_counter()
+        async with pool.acquire() as connection:
+            observe_latency("db.pool_acquire", time.perf_counter() - start)
+            return await connection.fetchrow(query, *args)
+
+    async def fetch(self, query, *args):
+        pool = self.pool or await get_pool()
+        start = time.perf_counter()
+        async with pool.acquire() as connection:
+            observe_latency("db.pool_acquire", time.perf_counter() - start)
+            return await connection.fetch(query, *args)
+
+    async def execute(self, query, *args):
+        pool = self.pool or await get_pool()
+        start = time.perf_counter()
+        async with pool.acquire() as connection:
+            observe_latency("db.pool_acquire", time.perf_counter() - start)
+            return await connection.execute(query, *args)
+
+repo = Repository()
+
+@asynccontextmanager
+async def acquire():
+    """
+    プールから接続を借りる。接続が空くまでの待ち時間を計測して記録する。
+    """
+    pool = await get_pool()
+    start = time.perf_counter()
+    async with pool.acquire() as connection:
+        observe_latency("db.pool_acquire", time.perf_counter() - start)
+        yield connection
+
+def register_pending_flush(flush):
+    """
+    メモリ上にだけある未保存の書き込みをDBへ反映する関数を登録する。
+    登録した関数は close_pool で接続プールを閉じる直前に呼ばれる。
+    """
+    _pending_flushes.append(flush)
+
 async def close_pool():
     """
-    データベース接続プールを安全に閉じる。
+    データベース接続プールを安全に閉じる。閉じる前に未保存の書き込みを反映する。
     """
     global _pool
     if _pool and not _pool._closed:
+        for flush in _pending_flushes:
+            try:
+                await flush()
+            except Exception:
+                pass  # エラーは各 flush 側で記録済み
         await _pool.close()
         _pool = None
+        repo.pool = None
         logging.info("✅ データベース接続プールを閉じました")
 
+@timed("db.ping")
+async def ping():
+    """
+    データベースへの疎通を確認する（ヘルスチェック用）。
+    """
+    await repo.fetchval("SELECT 1")
+
+def get_pool_stats():
+    """
+    接続プールのサイズと空き接続数を返す。プール未作成なら None。
+    """
+    if _pool is None or _pool._closed:
+        return None
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    max_size = _pool.get_max_size()
+    in_use = size - idle
+    return {
+        "size": size,
+        "idle": idle,
+        "in_use": in_use,
+        "max_size": max_size,
+        # 使用中の接続が上限に占める割合。1.0に近いほど接続待ちが起きやすい。
+        "saturation": in_use / max_size if max_size else 0.0,
+    }
+
+@timed("db.init_db")
 async def init_db():
     """
-    BUMPくん機能用のテーブルを初期化する。
+    BUMPくん機能用のテーブルを初期化する（未適用のマイグレーションだけを適用する）。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id BIGINT PRIMARY KEY,
-                bump_count INTEGER NOT NULL DEFAULT 0
-            );
-        ''')
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS reminders (
-                id SERIAL PRIMARY KEY,
-                channel_id BIGINT NOT NULL,
-                remind_at TIMESTAMP WITH TIME ZONE NOT NULL,
-                status TEXT NOT NULL DEFAULT 'waiting'
-            );
-        ''')
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            );
-        ''')
-        await connection.execute('''
-            INSERT INTO settings (key, value) VALUES ('scan_completed', 'false')
-            ON CONFLICT (key) DO NOTHING;
-        ''')
+    async with acquire() as connection:
+        await migrate(connection, "bump")
     logging.info("✅ BUMPくん用テーブルを初期化しました")
 
+@timed("db.is_scan_completed")
 async def is_scan_completed():
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        record = await connection.fetchrow("SELECT value FROM settings WHERE key = 'scan_completed'")
+    record = await repo.fetchrow("SELECT value FROM settings WHERE key = 'scan_completed'")
     return record and record['value'] == 'true'
 
+@timed("db.mark_scan_as_completed")
 async def mark_scan_as_completed():
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute("UPDATE settings SET value = 'true' WHERE key = 'scan_completed'")
-
-async def record_bump(user_id):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('''
-            INSERT INTO users (user_id, bump_count) VALUES ($1, 1)
-            ON CONFLICT (user_id) DO UPDATE SET bump_count = users.bump_count + 1;
-        ''', user_id)
-        count = await connection.fetchval('SELECT bump_count FROM users WHERE user_id = $1', user_id)
-    return count
-
-async def get_top_users(limit=5):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        records = await connection.fetch(
-            'SELECT user_id, bump_count FROM users ORDER BY bump_count DESC LIMIT $1', limit
-        )
-    return records
+    await repo.execute("UPDATE settings SET value = 'true' WHERE key = 'scan_completed'")
 
-async def get_user_count(user_id):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        count = await connection.fetchval('SELECT bump_count FROM users WHERE user_id = $1', user_id)
-    return count or 0
+@timed("db.get_all_bump_counts")
+async def get_all_bump_counts():
+    """
+    全ユーザーのBUMP数を取得する（メモリ内カウンターの読み込み用）。
+    """
+    return await repo.fetch('SELECT user_id, bump_count FROM users')
 
+@timed("db.add_bump_counts")
+async def add_bump_counts(increments):
+    """
+    (user_id, 増分) のリストを1つのINSERT文でまとめてBUMP数に加算する。
+    """
+    if not increments:
+        return
+    user_ids, deltas = zip(*increments)
+    await repo.execute('''
+        INSERT INTO users (user_id, bump_count)
+        SELECT user_id, delta FROM unnest($1::bigint[], $2::int[]) AS t(user_id, delta)
+        ON CONFLICT (user_id) DO UPDATE SET bump_count = users.bump_count + EXCLUDED.bump_count;
+    ''', list(user_ids), list(deltas))
+
+@timed("db.set_reminder")
 async def set_reminder(channel_id, remind_time):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
+    async with acquire() as connection:
         await connection.execute('DELETE FROM reminders')
         await connection.execute('INSERT INTO reminders (channel_id, remind_at) VALUES ($1, $2)', channel_id, remind_time)
 
+@timed("db.get_reminder")
 async def get_reminder():
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        record = await connection.fetchrow(
-            'SELECT channel_id, remind_at, status FROM reminders ORDER BY remind_at LIMIT 1'
-        )
+    record = await repo.fetchrow(
+        'SELECT channel_id, remind_at, status FROM reminders ORDER BY remind_at LIMIT 1'
+    )
     return record
 
+@timed("db.update_reminder_status")
 async def update_reminder_status(channel_id, new_status):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute(
-            'UPDATE reminders SET status = $1 WHERE channel_id = $2', new_status, channel_id
-        )
+    await repo.execute(
+        'UPDATE reminders SET status = $1 WHERE channel_id = $2', new_status, channel_id
+    )
 
+@timed("db.clear_reminder")
 async def clear_reminder():
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('DELETE FROM reminders')
-
-async def get_total_bumps():
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        total = await connection.fetchval('SELECT SUM(bump_count) FROM users')
-    return total or 0
+    await repo.execute('DELETE FROM reminders')
 
+@timed("db.init_intro_bot_db")
 async def init_intro_bot_db():
     """
     自己紹介Bot用のデータベーステーブルを初期化または更新する。
-    テーブルが存在しない場合は新規作成し、古いスキーマ（テーブル構造）の場合は
-    'created_at'カラムを自動的に追加して互換性を保つ。
+    テーブル定義は migrations.py にあり、未適用のマイグレーションだけを適用する。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        # 1. テーブルが存在しない場合に備えて、最新の定義で作成を試みる
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS introductions (
-                user_id BIGINT PRIMARY KEY,
-                channel_id BIGINT NOT NULL,
-                message_id BIGINT NOT NULL,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
+    async with acquire() as connection:
+        await migrate(connection, "intro_bot")
+    logging.info("✅ 自己紹介Bot用テーブルを初期化しました")
 
-        # 2. 'created_at' カラムの存在をチェック
-        column_exists = await connection.fetchval('''
-            SELECT EXISTS (
-                SELECT 1
-                FROM   information_schema.columns
-                WHERE  table_name = 'introductions'
-                AND    column_name = 'created_at'
-            );
-        ''')
+@timed("db.save_intro")
+async def save_intro(user_id, channel_id, message_id, content=None, jump_url=None):
+    """
+    ユーザーの自己紹介情報をデータベースに保存または更新する（自己紹介チャンネルごとに1件）。
+    content・jump_url はVC入室通知に使うスナップショット（本文は切り詰め済みのもの）。
+    新規作成なら True、既存レコードの更新なら False を返す。
+    """
+    # INSERT ... ON CONFLICT を使い、レコードが存在すればUPDATE、なければINSERTを実行する。
+    # xmax = 0 は今回のINSERTで作られた行であることを表すので、
+    # 事前のSELECTなしに1回の往復で新規か更新かを判定できる。
+    # created_atをCURRENT_TIMESTAMPで更新することで、最新の投稿日時を記録する。
+    inserted = await repo.fetchval(
+        SAVE_INTRO_SQL, user_id, channel_id, message_id, content, jump_url
+    )
+
+    if inserted:
+        logging.info("🆕 新しい自己紹介を保存: User %s", user_id)
+    else:
+        logging.debug("🔄 自己紹介を更新: User %s", user_id)
+    return inserted
 
-        # 3. カラムが存在しない場合のみ、追加処理を実行
-        if not column_exists:
-            logging.info("📝 'introductions'テーブルに'created_at'カラムが存在しないため、追加処理を実行します...")
-            await connection.execute('''
-                ALTER TABLE introductions
-                ADD COLUMN created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
-            ''')
-            logging.info("✅ 'created_at'カラムの追加が完了しました。")
-
-        # ユーザーID検索を高速化するためのインデックスを作成（存在しない場合のみ）
-        await connection.execute('''
-            CREATE INDEX IF NOT EXISTS idx_introductions_user_id ON introductions(user_id);
-        ''')
-    logging.info("✅ 自己紹介Bot用テーブルを初期化しました")
+@timed("db.save_intros_bulk")
+async def save_intros_bulk(rows):
+    """
+    (user_id, channel_id, message_id, content, jump_url) のタプルのリストを1つのINSERT文で一括保存する。
+    すべてのメッセージを introduction_messages に記録し、introductions にはチャンネル・投稿者ごとに
+    最新のメッセージだけを保存する。既存レコードより新しいメッセージIDの場合のみ更新するため、
+    履歴を新しい順に読み込んでも古い自己紹介で上書きされることはない。
+    戻り値は (新規件数, 更新件数)。
+    """
+    if not rows:
+        return 0, 0
+    user_ids, channel_ids, message_ids, contents, jump_urls = zip(*rows)
+    results = await repo.fetch('''
+        WITH t AS (
+            SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::text[], $5::text[])
+                AS t(user_id, channel_id, message_id, content, jump_url)
+        ), logged AS (
+            INSERT INTO introduction_messages (message_id, user_id, channel_id, content, jump_url)
+            SELECT message_id, user_id, channel_id, content, jump_url FROM t
+            ON CONFLICT (message_id) DO UPDATE SET
+                content = EXCLUDED.content,
+                jump_url = EXCLUDED.jump_url
+        )
+        INSERT INTO introductions (user_id, channel_id, message_id, created_at, content, jump_url)
+        SELECT DISTINCT ON (channel_id, user_id) user_id, channel_id, message_id, CURRENT_TIMESTAMP, content, jump_url
+        FROM t
+        ORDER BY channel_id, user_id, message_id DESC
+        ON CONFLICT (channel_id, user_id) DO UPDATE SET
+            message_id = EXCLUDED.message_id,
+            created_at = EXCLUDED.created_at,
+            content = EXCLUDED.content,
+            jump_url = EXCLUDED.jump_url
+        WHERE introductions.message_id < EXCLUDED.message_id
+           OR (introductions.message_id = EXCLUDED.message_id AND introductions.content IS NULL)
+        RETURNING (xmax = 0) AS inserted;
+    ''', list(user_ids), list(channel_ids), list(message_ids), list(contents), list(jump_urls))
+    inserted_count = sum(1 for row in results if row['inserted'])
+    return inserted_count, len(results) - inserted_count
+
+@timed("db.get_intro_scan_cursor")
+async def get_intro_scan_cursor(channel_id):
+    """
+    指定チャンネルの起動時スキャンで最後に読み込んだメッセージIDを取得する。
+    """
+    value = await repo.fetchval(
+        "SELECT value FROM settings WHERE key = $1", f"intro_scan_cursor:{channel_id}"
+    )
+    return int(value) if value else None
 
-async def save_intro(user_id, channel_id, message_id):
+@timed("db.set_intro_scan_cursor")
+async def set_intro_scan_cursor(channel_id, message_id):
     """
-    ユーザーの自己紹介情報をデータベースに保存または更新する。
+    指定チャンネルの起動時スキャンで最後に読み込んだメッセージIDを保存する。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        # 更新か新規作成かをログで区別するために、先に存在チェックを行う
-        existing = await connection.fetchrow(
-            "SELECT user_id FROM introductions WHERE user_id = $1", user_id
+    await repo.execute('''
+        INSERT INTO settings (key, value) VALUES ($1, $2)
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+    ''', f"intro_scan_cursor:{channel_id}", str(message_id))
+
+@timed("db.mark_intro_message_edited")
+async def mark_intro_message_edited(message_id, content=None):
+    """
+    自己紹介メッセージの編集を記録する。content（切り詰め済みの本文）を渡すとスナップショットも更新する。
+    記録済みの自己紹介メッセージなら True を返す。
+    """
+    user_id = await repo.fetchval('''
+        WITH edited AS (
+            UPDATE introduction_messages
+            SET edited_at = CURRENT_TIMESTAMP, content = COALESCE($2::text, content)
+            WHERE message_id = $1
+            RETURNING user_id, channel_id
+        ), current AS (
+            UPDATE introductions SET content = $2::text
+            FROM edited
+            WHERE $2::text IS NOT NULL
+              AND introductions.channel_id = edited.channel_id
+              AND introductions.user_id = edited.user_id
+              AND introductions.message_id = $1
         )
-        
-        # INSERT ... ON CONFLICT を使い、レコードが存在すればUPDATE、なければINSERTを実行する。
-        # これにより、コードがシンプルになり、アトミックな操作が保証される。
-        # created_atをCURRENT_TIMESTAMPで更新することで、最新の投稿日時を記録する。
-        await connection.execute('''
-            INSERT INTO introductions (user_id, channel_id, message_id, created_at) 
-            VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
-            ON CONFLICT (user_id) DO UPDATE SET 
-                channel_id = EXCLUDED.channel_id, 
-                message_id = EXCLUDED.message_id, 
-                created_at = EXCLUDED.created_at;
-        ''', user_id, channel_id, message_id)
-        
-        if existing:
-            logging.debug(f"🔄 自己紹介を更新: User {user_id}")
-        else:
-            logging.info(f"🆕 新しい自己紹介を保存: User {user_id}")
+        SELECT user_id FROM edited
+    ''', message_id, content)
+    return user_id is not None
 
-async def get_intro_ids(user_id):
+@timed("db.get_intro_snapshot")
+async def get_intro_snapshot(user_id, channel_id):
     """
-    ユーザーIDに基づいて、自己紹介のチャンネルIDとメッセージIDを取得する。
+    指定した自己紹介チャンネルでのユーザーの現在の自己紹介のスナップショット
+    （チャンネルID・メッセージID・本文・jump_url）を取得する。
+    スナップショットを保存する前の行は content が NULL になる。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        record = await connection.fetchrow(
-            "SELECT channel_id, message_id FROM introductions WHERE user_id = $1", user_id
+    return await repo.fetchrow(GET_INTRO_SNAPSHOT_SQL, user_id, channel_id)
+
+@timed("db.save_intro_snapshot")
+async def save_intro_snapshot(user_id, channel_id, message_id, content, jump_url):
+    """
+    スナップショットがない既存の自己紹介に、取得したメッセージのスナップショットを保存する。
+    """
+    await repo.execute('''
+        WITH logged AS (
+            UPDATE introduction_messages SET content = $4, jump_url = $5
+            WHERE message_id = $3
         )
+        UPDATE introductions SET content = $4, jump_url = $5
+        WHERE channel_id = $2 AND user_id = $1 AND message_id = $3
+    ''', user_id, channel_id, message_id, content, jump_url)
+
+@timed("db.delete_intro_messages")
+async def delete_intro_messages(message_ids):
+    """
+    自己紹介メッセージの削除を記録し、削除されたメッセージを現在の自己紹介としていたユーザーを
+    同じチャンネルの削除されていない一つ前の自己紹介に戻す（なければ introductions から削除する）。
+    現在の自己紹介が変わったものについて {(channel_id, user_id): message_id または None} を返す。
+    """
+    message_ids = list(message_ids)
+    async with acquire() as connection:
+        async with connection.transaction():
+            await connection.execute('''
+                UPDATE introduction_messages SET deleted_at = CURRENT_TIMESTAMP
+                WHERE message_id = ANY($1::bigint[]) AND deleted_at IS NULL
+            ''', message_ids)
+            records = await connection.fetch('''
+                SELECT i.channel_id, i.user_id, p.message_id, p.created_at, p.content, p.jump_url
+                FROM introductions i
+                LEFT JOIN LATERAL (
+                    SELECT m.message_id, m.created_at, m.content, m.jump_url
+                    FROM introduction_messages m
+                    WHERE m.channel_id = i.channel_id AND m.user_id = i.user_id AND m.deleted_at IS NULL
+                    ORDER BY m.message_id DESC
+                    LIMIT 1
+                ) p ON TRUE
+                WHERE i.message_id = ANY($1::bigint[])
+                FOR UPDATE OF i
+            ''', message_ids)
+            fallbacks = [r for r in records if r['message_id'] is not None]
+            if fallbacks:
+                await connection.executemany('''
+                    UPDATE introductions SET message_id = $3, created_at = $4, content = $5, jump_url = $6
+                    WHERE channel_id = $1 AND user_id = $2
+                ''', [(r['channel_id'], r['user_id'], r['message_id'], r['created_at'],
+                       r['content'], r['jump_url']) for r in fallbacks])
+            removed = [r for r in records if r['message_id'] is None]
+            if removed:
+                await connection.execute('''
+                    DELETE FROM introductions
+                    WHERE (channel_id, user_id) IN (
+                        SELECT * FROM unnest($1::bigint[], $2::bigint[])
+                    )
+                ''', [r['channel_id'] for r in removed], [r['user_id'] for r in removed])
+
+    return {(record['channel_id'], record['user_id']): record['message_id'] for record in records}
+
+@timed("db.get_intro_ids")
+async def get_intro_ids(user_id, channel_id):
+    """
+    指定した自己紹介チャンネルでのユーザーの自己紹介のチャンネルIDとメッセージIDを取得する。
+    """
+    record = await repo.fetchrow(GET_INTRO_IDS_SQL, user_id, channel_id)
     
     if record:
-        logging.debug(f"✅ 自己紹介発見: User {user_id}")
+        logging.debug("✅ 自己紹介発見: User %s", user_id)
     else:
-        logging.debug(f"❌ 自己紹介未発見: User {user_id}")
+        logging.debug("❌ 自己紹介未発見: User %s", user_id)
     
     return record
 
+@timed("db.get_all_intro_ids")
+async def get_all_intro_ids():
+    """
+    全ユーザーの自己紹介のチャンネルIDとメッセージIDを取得する（インデックス読み込み用）。
+    """
+    records = await repo.fetch(
+        "SELECT user_id, channel_id, message_id FROM introductions"
+    )
+    return records
+
+@timed("db.get_intro_count")
 async def get_intro_count():
     """
     データベースに保存されている自己紹介の総数を取得する。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        count = await connection.fetchval("SELECT COUNT(*) FROM introductions")
+    count = await repo.fetchval("SELECT COUNT(*) FROM introductions")
     return count or 0
 
+@timed("db.list_recent_intros")
 async def list_recent_intros(limit=10):
     """
     最近投稿された自己紹介を最大指定件数まで取得する。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        records = await connection.fetch(
-            "SELECT user_id, channel_id, message_id, created_at FROM introductions ORDER BY created_at DESC LIMIT $1",
-            limit
-        )
+    records = await repo.fetch(
+        "SELECT user_id, channel_id, message_id, created_at FROM introductions ORDER BY created_at DESC LIMIT $1",
+        limit
+    )
     return records
 
+@timed("db.init_shugoshin_db")
 async def init_shugoshin_db():
     """
-    守護神ボット機能用のテーブルを初期化する。
+    守護神ボット機能用のテーブルを初期化する（未適用のマイグレーションだけを適用する）。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS reports (
-                report_id SERIAL PRIMARY KEY, guild_id BIGINT, message_id BIGINT,
-                target_user_id BIGINT, violated_rule TEXT, details TEXT,
-                message_link TEXT, urgency TEXT, status TEXT DEFAULT '未対応',
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS guild_settings (
-                guild_id BIGINT PRIMARY KEY,
-                report_channel_id BIGINT,
-                urgent_role_id BIGINT
-            );
-        ''')
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS report_cooldowns (
-                user_id BIGINT PRIMARY KEY,
-                last_report_at TIMESTAMP WITH TIME ZONE NOT NULL
-            );
-        ''')
+    async with acquire() as connection:
+        await migrate(connection, "shugoshin")
     logging.info("✅ 守護神ボット用テーブルを初期化しました")
 
+@timed("db.setup_guild")
 async def setup_guild(guild_id, report_channel_id, urgent_role_id):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('''
-            INSERT INTO guild_settings (guild_id, report_channel_id, urgent_role_id)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (guild_id) DO UPDATE
-            SET report_channel_id = $2, urgent_role_id = $3;
-        ''', guild_id, report_channel_id, urgent_role_id)
-
+    await repo.execute('''
+        INSERT INTO guild_settings (guild_id, report_channel_id, urgent_role_id)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (guild_id) DO UPDATE
+        SET report_channel_id = $2, urgent_role_id = $3;
+    ''', guild_id, report_channel_id, urgent_role_id)
+
+@timed("db.get_guild_settings")
 async def get_guild_settings(guild_id):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        settings = await connection.fetchrow(
-            "SELECT report_channel_id, urgent_role_id FROM guild_settings WHERE guild_id = $1",
-            guild_id
-        )
+    settings = await repo.fetchrow(
+        "SELECT report_channel_id, urgent_role_id FROM guild_settings WHERE guild_id = $1",
+        guild_id
+    )
     return settings
 
-async def check_cooldown(user_id, cooldown_seconds):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
+@timed("db.load_report_cooldowns")
+async def load_report_cooldowns():
+    """
+    まだ期限切れになっていないクールダウンのバケットを取得する（起動時の復元用）。
+    """
+    return await repo.fetch('''
+        SELECT user_id, guild_id, rule, tokens, last_report_at, expires_at
+        FROM report_cooldowns
+        WHERE expires_at > CURRENT_TIMESTAMP
+    ''')
+
+@timed("db.save_report_cooldowns")
+async def save_report_cooldowns(rows):
+    """
+    (user_id, guild_id, rule, tokens, last_report_at, expires_at) のリストを1つの文でまとめて保存し、
+    期限切れのバケットを削除する。
+    """
+    async with acquire() as connection:
         async with connection.transaction():
-            record = await connection.fetchrow(
-                "SELECT last_report_at FROM report_cooldowns WHERE user_id = $1", user_id
+            if rows:
+                user_ids, guild_ids, rules, tokens, updated, expires = zip(*rows)
+                await connection.execute('''
+                    INSERT INTO report_cooldowns (user_id, guild_id, rule, tokens, last_report_at, expires_at)
+                    SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[], $4::float8[],
+                                         $5::timestamptz[], $6::timestamptz[])
+                    ON CONFLICT (user_id, guild_id, rule) DO UPDATE SET
+                        tokens = EXCLUDED.tokens,
+                        last_report_at = EXCLUDED.last_report_at,
+                        expires_at = EXCLUDED.expires_at;
+                ''', list(user_ids), list(guild_ids), list(rules), list(tokens), list(updated), list(expires))
+            await connection.execute(
+                "DELETE FROM report_cooldowns WHERE expires_at IS NULL OR expires_at <= CURRENT_TIMESTAMP"
             )
-            now = datetime.datetime.now(datetime.timezone.utc)
-            if record:
-                time_since_last = now - record['last_report_at']
-                if time_since_last.total_seconds() < cooldown_seconds:
-                    return cooldown_seconds - time_since_last.total_seconds()
-            await connection.execute('''
-                INSERT INTO report_cooldowns (user_id, last_report_at) VALUES ($1, $2)
-                ON CONFLICT (user_id) DO UPDATE SET last_report_at = $2;
-            ''', user_id, now)
-            return 0
 
+@timed("db.create_report")
 async def create_report(guild_id, target_user_id, violated_rule, details, message_link, urgency):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        report_id = await connection.fetchval(
-            '''INSERT INTO reports (guild_id, target_user_id, violated_rule, details, message_link, urgency) 
-               VALUES ($1, $2, $3, $4, $5, $6) RETURNING report_id''',
-            guild_id, target_user_id, violated_rule, details, message_link, urgency
-        )
-    return report_id
+    async with acquire() as connection:
+        async with connection.transaction():
+            record = await connection.fetchrow(
+                '''INSERT INTO reports (guild_id, target_user_id, violated_rule, details, message_link, urgency) 
+                   VALUES ($1, $2, $3, $4, $5, $6) RETURNING report_id, status''',
+                guild_id, target_user_id, violated_rule, details, message_link, urgency
+            )
+            await connection.execute(
+                ADJUST_REPORT_STATUS_COUNTS_SQL, guild_id or 0, [record['status']], [1]
+            )
+    return record['report_id']
 
+@timed("db.update_report_message_id")
 async def update_report_message_id(report_id, message_id):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute(
-            "UPDATE reports SET message_id = $1 WHERE report_id = $2",
-            message_id, report_id
-        )
+    await repo.execute(
+        "UPDATE reports SET message_id = $1 WHERE report_id = $2",
+        message_id, report_id
+    )
 
+@timed("db.update_report_status")
 async def update_report_status(report_id, new_status):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute(
-            "UPDATE reports SET status = $1 WHERE report_id = $2",
-            new_status, report_id
-        )
+    async with acquire() as connection:
+        async with connection.transaction():
+            old = await connection.fetchrow(
+                "SELECT guild_id, status FROM reports WHERE report_id = $1 FOR UPDATE", report_id
+            )
+            if old is None or old['status'] == new_status:
+                return
+            await connection.execute(
+                "UPDATE reports SET status = $1 WHERE report_id = $2",
+                new_status, report_id
+            )
+            statuses, deltas = [new_status], [1]
+            if old['status'] is not None:
+                statuses.append(old['status'])
+                deltas.append(-1)
+            await connection.execute(
+                ADJUST_REPORT_STATUS_COUNTS_SQL, old['guild_id'] or 0, statuses, deltas
+            )
 
+@timed("db.get_report")
 async def get_report(report_id):
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        record = await connection.fetchrow("SELECT * FROM reports WHERE report_id = $1", report_id)
+    record = await repo.fetchrow("SELECT * FROM reports WHERE report_id = $1", report_id)
     return record
 
-async def list_reports(status_filter=None):
-    pool = await get_pool()
+@timed("db.list_reports")
+async def list_reports(status_filter=None, guild_id=None, before_id=None, limit=20):
+    """
+    レポートを新しい順に最大 limit 件取得する。
+    次のページは、前のページの最後の report_id を before_id に渡して取得する（キーセットページング）。
+    """
     query = "SELECT report_id, target_user_id, status FROM reports"
+    conditions = []
     params = []
+    if guild_id is not None:
+        params.append(guild_id)
+        conditions.append(f"guild_id = ${len(params)}")
     if status_filter and status_filter != 'all':
-        query += " WHERE status = $1"
         params.append(status_filter)
-    query += " ORDER BY report_id DESC LIMIT 20"
-    async with pool.acquire() as connection:
-        records = await connection.fetch(query, *params)
+        conditions.append(f"status = ${len(params)}")
+    if before_id is not None:
+        params.append(before_id)
+        conditions.append(f"report_id < ${len(params)}")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    params.append(limit)
+    query += f" ORDER BY report_id DESC LIMIT ${len(params)}"
+    records = await repo.fetch(query, *params)
     return records
 
-async def get_report_stats():
+@timed("db.get_report_stats")
+async def get_report_stats(guild_id=None):
     """
-    レポートのステータスごとの件数を集計して取得する。
+    レポートのステータスごとの件数を取得する（件数テーブルを読むだけで、reports は集計しない）。
+    guild_id を指定するとそのサーバーの件数だけを返す。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        stats = await connection.fetch('''
-            SELECT status, COUNT(*) as count 
-            FROM reports 
+    if guild_id is None:
+        stats = await repo.fetch('''
+            SELECT status, SUM(count)::bigint AS count
+            FROM report_status_counts
             GROUP BY status
+            HAVING SUM(count) > 0
         ''')
+    else:
+        stats = await repo.fetch('''
+            SELECT status, count
+            FROM report_status_counts
+            WHERE guild_id = $1 AND count > 0
+        ''', guild_id)
     # 取得したレコードのリストを {'ステータス名': 件数} の形式の辞書に変換して返す
     return {row['status']: row['count'] for row in stats}
 
-async def get_members_without_intro(guild_members):
-    """
-    サーバーメンバーのうち、自己紹介をしていないメンバーのリストを取得する。
-    """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        # データベースに自己紹介が記録されているユーザーIDを取得
-        intro_users = await connection.fetch("SELECT user_id FROM introductions")
-        intro_user_ids = {row['user_id'] for row in intro_users}
-        
-        # サーバーメンバーから自己紹介未投稿のメンバーを抽出
-        members_without_intro = []
-        for member in guild_members:
-            if not member.bot and member.id not in intro_user_ids:
-                members_without_intro.append(member)
-        
-        return members_without_intro
-
+@timed("db.init_daily_reminder_db")
 async def init_daily_reminder_db():
     """
-    日次リマインダー機能用のテーブルを初期化する。
+    日次リマインダー機能用のテーブルを初期化する（未適用のマイグレーションだけを適用する）。
     """
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS daily_reminder_log (
-                id SERIAL PRIMARY KEY,
-                reminder_date DATE NOT NULL DEFAULT CURRENT_DATE,
-                notified_users TEXT[],
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        await connection.execute('''
-            CREATE INDEX IF NOT EXISTS idx_daily_reminder_date ON daily_reminder_log(reminder_date);
-        ''')
+    async with acquire() as connection:
+        await migrate(connection, "daily_reminder")
     logging.info("✅ 日次リマインダー用テーブルを初期化しました")
 
-async def check_daily_reminder_sent(date=None):
+@timed("db.check_daily_reminder_sent")
+async def check_daily_reminder_sent(date=None, guild_id=0):
     """
-    指定した日付（デフォルトは今日）にリマインダーが送信済みかチェックする。
+    指定した日付（デフォルトは今日）に、指定したサーバーへリマインダーが送信済みかチェックする。
     """
     if date is None:
         date = datetime.date.today()
     
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        record = await connection.fetchrow(
-            "SELECT id FROM daily_reminder_log WHERE reminder_date = $1", date
-        )
+    record = await repo.fetchrow(CHECK_DAILY_REMINDER_SQL, date, guild_id)
     return record is not None
 
-async def log_daily_reminder(notified_user_ids, date=None):
+@timed("db.sync_reminder_recipients")
+async def sync_reminder_recipients(user_ids, guild_id=0):
+    """
+    そのサーバーの現在のリマインダー対象者（user_ids）を渡し、対象から外れた人（自己紹介済み・退出済み）を
+    reminder_recipients から削除したうえで、まだ記録されていない（新たに対象者になった）人を返す。
+    IDの配列を送るのはこの1回だけで、対象者のままの人の行には触れない。渡した順序を保ったIDのリストを返す。
+    """
+    records = await repo.fetch('''
+        WITH current AS (
+            SELECT user_id, ord FROM unnest($1::bigint[]) WITH ORDINALITY AS u(user_id, ord)
+        ), departed AS (
+            DELETE FROM reminder_recipients r
+            WHERE r.guild_id = $2
+              AND NOT EXISTS (SELECT 1 FROM current c WHERE c.user_id = r.user_id)
+        )
+        SELECT c.user_id
+        FROM current c
+        WHERE NOT EXISTS (
+            SELECT 1 FROM reminder_recipients r WHERE r.guild_id = $2 AND r.user_id = c.user_id
+        )
+        ORDER BY c.ord
+    ''', list(user_ids), guild_id)
+    return [record['user_id'] for record in records]
+
+@timed("db.log_daily_reminder")
+async def log_daily_reminder(notified_count, new_user_ids=(), date=None, guild_id=0):
     """
-    日次リマインダーの送信ログを記録する。
+    日次リマインダーの送信ログを記録し、sync_reminder_recipients が返した新しい対象者だけを
+    reminder_recipients に追加する（既存の行は更新しない。last_notified_on は追加した日のまま）。
     """
     if date is None:
         date = datetime.date.today()
-    
-    pool = await get_pool()
-    async with pool.acquire() as connection:
-        await connection.execute('''
-            INSERT INTO daily_reminder_log (reminder_date, notified_users)
-            VALUES ($1, $2)
-            ON CONFLICT DO NOTHING
-        ''', date, notified_user_ids)
\ No newline at end of file
+
+    async with acquire() as connection:
+        async with connection.transaction():
+            await connection.execute('''
+                INSERT INTO daily_reminder_log (reminder_date, notified_count, guild_id)
+                VALUES ($1, $2, $3)
+            ''', date, notified_count, guild_id)
+            if new_user_ids:
+                await connection.execute('''
+                    INSERT INTO reminder_recipients (guild_id, user_id, first_notified_on, last_notified_on)
+                    SELECT $3, user_id, $2, $2 FROM unnest($1::bigint[]) AS u(user_id)
+                    ON CONFLICT (guild_id, user_id) DO NOTHING
+                ''', list(new_user_ids), date, guild_id)
+
+@timed("db.get_job_next_run")
+async def get_job_next_run(name):
+    """
+    定期ジョブの保存済みの次回実行時刻を取得する。未保存なら None。
+    """
+    return await repo.fetchval("SELECT next_run_at FROM scheduled_jobs WHERE name = $1", name)
+
+@timed("db.set_job_next_run")
+async def set_job_next_run(name, next_run_at, last_run_at=None):
+    """
+    定期ジョブの次回実行時刻（と最終実行時刻）を保存する。
+    """
+    await repo.execute('''
+        INSERT INTO scheduled_jobs (name, next_run_at, last_run_at) VALUES ($1, $2, $3)
+        ON CONFLICT (name) DO UPDATE SET
+            next_run_at = EXCLUDED.next_run_at,
+            last_run_at = COALESCE(EXCLUDED.last_run_at, scheduled_jobs.last_run_at);
+    ''', name, next_run_at, last_run_at)
+
+@timed("db.try_acquire_job_lease")
+async def try_acquire_job_lease(name, guild_id, holder, ttl_seconds):
+    """
+    サーバーごとのジョブの担当リースを取得する。
+    リースがない・期限切れ・自分が持っている場合だけ取得（延長）でき、取得できたら True を返す。
+    """
+    acquired = await repo.fetchval('''
+        INSERT INTO job_leases (name, guild_id, holder, expires_at)
+        VALUES ($1, $2, $3, now() + make_interval(secs => $4))
+        ON CONFLICT (name, guild_id) DO UPDATE
+            SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+            WHERE job_leases.holder = EXCLUDED.holder OR job_leases.expires_at < now()
+        RETURNING holder
+    ''', name, guild_id, holder, float(ttl_seconds))
+    return acquired is not None
+
+@timed("db.release_job_lease")
+async def release_job_lease(name, guild_id, holder):
+    """
+    自分が持っているジョブの担当リースを手放す。
+    """
+    await repo.execute(
+        "DELETE FROM job_leases WHERE name = $1 AND guild_id = $2 AND holder = $3", name, guild_id, holder
+    )
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import math
+from aiohttp import web
+import database as db
+from metrics import render_prometheus
+
+# ゲートウェイのレイテンシがこの秒数を超えたら不健康とみなす
+MAX_GATEWAY_LATENCY_SECONDS = 10
+# DBの疎通確認のタイムアウト秒数
+DB_PING_TIMEOUT_SECONDS = 2
+
+async def _check_database():
+    try:
+        await asyncio.wait_for(db.ping(), timeout=DB_PING_TIMEOUT_SECONDS)
+        return True
+    except Exception as e:
+        logging.warning(f"⚠️ ヘルスチェックでDB疎通確認に失敗しました: {e}")
+        return False
+
+def create_app(bot):
+    """
+    Botと同じイベントループ上で動くヘルスチェック・メトリクス用のWebアプリを作成する。
+    """
+    async def home(request):
+        return web.Response(text="Self-Introduction Bot v2 is running!")
+
+    async def health(request):
+        latency = bot.latency
+        checks = {
+            "gateway_ready": bot.is_ready(),
+            "gateway_latency_ok": math.isfinite(latency) and latency < MAX_GATEWAY_LATENCY_SECONDS,
+            "database": await _check_database(),
+        }
+        healthy = all(checks.values())
+        return web.json_response(
+            {"status": "ok" if healthy else "unhealthy", "latency": latency if math.isfinite(latency) else None, **checks},
+            status=200 if healthy else 503,
+        )
+
+    async def metrics(request):
+        return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+async def start_health_server(bot, port):
+    """
+    ヘルスチェック用サーバーを起動し、終了時に cleanup するための AppRunner を返す。
+    """
+    runner = web.AppRunner(create_app(bot), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "0.0.0.0", port)
+    await site.start()
+    return runner
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from array import array
+import discord
+import database as db
+from ttl_cache import TTLCache
+
+# 埋め込みの説明文の文字数の上限（Discordの仕様）
+EMBED_DESCRIPTION_LIMIT = 4096
+
+def truncate_intro_content(content):
+    """
+    自己紹介の本文を埋め込みの説明文の上限に収まるように切り詰める。
+    """
+    content = content or ""
+    if len(content) > EMBED_DESCRIPTION_LIMIT:
+        content = content[:EMBED_DESCRIPTION_LIMIT - 1] + "…"
+    return content
+
+def snapshot_message(message):
+    """
+    自己紹介メッセージから、DBに保存するスナップショット (本文, jump_url) を作る。
+    VC入室時はこのスナップショットから通知を組み立て、fetch_message を呼ばない。
+    """
+    return truncate_intro_content(message.content), message.jump_url
+
+class IntroIndex:
+    """
+    自己紹介チャンネルID -> {user_id: message_id} の自己紹介インデックス。
+    自己紹介はサーバー（自己紹介チャンネル）ごとに別々に持つので、別のサーバーでの自己紹介で上書きされない。
+    起動時に一度だけDBから読み込み、以降は自己紹介の保存・削除・起動時スキャンに合わせて更新することで、
+    VC入室のたびにDBへ問い合わせる必要をなくす。
+    読み込み中に行われた更新は、読み込んだ内容に上書きされないよう読み込み後に適用し直す。
+    asyncpgのRecordは保持せず、intだけを持つ。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        # 読み込み中に行われた更新 (メソッド名, 引数)。読み込み中でなければ None
+        self._pending_updates = None
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        """
+        DBから全件を読み込み、インデックスを作り直す。
+        """
+        self._pending_updates = []
+        try:
+            records = await db.get_all_intro_ids()
+            entries = {}
+            for record in records:
+                entries.setdefault(record['channel_id'], {})[record['user_id']] = record['message_id']
+            pending, self._pending_updates = self._pending_updates, None
+            self._entries = entries
+            for method, args in pending:
+                getattr(self, method)(*args)
+        finally:
+            self._pending_updates = None
+        self.loaded = True
+        logging.info(f"🗂️ 自己紹介インデックスを読み込みました ({len(records)}件)")
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load()
+
+    async def lookup(self, user_id, channel_id):
+        """
+        指定した自己紹介チャンネルでの (channel_id, message_id) を返す。自己紹介がなければ None。
+        読み込み前はDBに問い合わせる。
+        """
+        if not self.loaded:
+            record = await db.get_intro_ids(user_id, channel_id)
+            return (record['channel_id'], record['message_id']) if record else None
+        return self.get(user_id, channel_id)
+
+    def get(self, user_id, channel_id):
+        message_id = self._entries.get(channel_id, {}).get(user_id)
+        if message_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return channel_id, message_id
+
+    def put(self, user_id, channel_id, message_id):
+        if self._pending_updates is not None:
+            self._pending_updates.append(("put", (user_id, channel_id, message_id)))
+        self._entries.setdefault(channel_id, {})[user_id] = message_id
+
+    def put_if_newer(self, user_id, channel_id, message_id):
+        """
+        登録済みの自己紹介より新しいメッセージの場合だけ登録する（起動時スキャン用）。
+        """
+        if self._pending_updates is not None:
+            self._pending_updates.append(("put_if_newer", (user_id, channel_id, message_id)))
+        users = self._entries.setdefault(channel_id, {})
+        if users.get(user_id, 0) < message_id:
+            users[user_id] = message_id
+
+    def discard(self, user_id, channel_id):
+        if self._pending_updates is not None:
+            self._pending_updates.append(("discard", (user_id, channel_id)))
+        self._entries.get(channel_id, {}).pop(user_id, None)
+
+    def find_members_without_intro(self, members, limit, channel_id):
+        """
+        メンバーのうち、指定した自己紹介チャンネルに自己紹介が未登録の人を探す（botは除外）。
+        全件のMemberリストは作らず、表示に使う先頭limit人とIDの配列だけを返す。
+        戻り値は (対象人数, 先頭limit人のメンバー, 対象メンバーIDの配列)。
+        """
+        entries = self._entries.get(channel_id, {})
+        first_members = []
+        missing_ids = array('Q')
+        for member in members:
+            if member.bot or member.id in entries:
+                continue
+            if len(first_members) < limit:
+                first_members.append(member)
+            missing_ids.append(member.id)
+        return len(missing_ids), first_members, missing_ids
+
+    def __len__(self):
+        return sum(len(users) for users in self._entries.values())
+
+    def stats(self):
+        return {
+            "channels": len(self._entries),
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class IntroMessageCache:
+    """
+    message_id -> (埋め込みのペイロード, jump_url) のキャッシュ。
+    同じ人がVCを移動するたびに fetch_message を呼ばずに済むようにする。
+    メッセージの編集・削除時には invalidate で破棄する。
+    """
+
+    def __init__(self, max_size, ttl_seconds):
+        self._cache = TTLCache(max_size, ttl_seconds)
+
+    def get(self, message_id):
+        return self._cache.get(message_id)
+
+    def put_message(self, message):
+        """
+        自己紹介メッセージから埋め込みのペイロードを作ってキャッシュする。
+        """
+        return self.put_snapshot(message.id, truncate_intro_content(message.content), message.jump_url)
+
+    def put_snapshot(self, message_id, content, jump_url):
+        """
+        DBに保存された自己紹介のスナップショットから埋め込みのペイロードを作ってキャッシュする。
+        """
+        payload = {
+            "description": content,
+            "color": discord.Color.blue().value,
+        }
+        entry = (payload, jump_url)
+        self._cache.put(message_id, entry)
+        return entry
+
+    def invalidate(self, message_id):
+        self._cache.pop(message_id)
+
+    def stats(self):
+        return self._cache.stats()
@@ -0,0 +1,88 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+TEXT_DATEFMT = '%Y-%m-%d %H:%M:%S'
+
+# 高頻度イベントのログに付ける extra。LOG_SAMPLE_RATE 件に1件だけ出力される。
+SAMPLED = {"sampled": True}
+
+class JsonFormatter(logging.Formatter):
+    """
+    1行1レコードのJSON形式でログを出力するフォーマッター。
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SamplingFilter(logging.Filter):
+    """
+    extra={"sampled": True} 付きのレコードを、メッセージのテンプレートごとに rate 件に1件だけ通す。
+    警告以上のレベルは常に通す。
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counts = {}
+
+    def filter(self, record):
+        if self.rate == 1 or not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        return count % self.rate == 0
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    メッセージの組み立てをリスナースレッド側に任せる QueueHandler。
+    標準の QueueHandler は enqueue 前に format してしまうため、prepare を素通しにしている。
+    """
+
+    def prepare(self, record):
+        return record
+
+def setup_logging():
+    """
+    環境変数に従ってルートロガーを設定する。
+    LOG_LEVEL: debug/info/warning/error（既定 info）
+    LOG_FORMAT: text/json（既定 text）
+    LOG_SAMPLE_RATE: 高頻度イベントのログを何件に1件出すか（既定 1 = 全件）
+    ログの書き出しは QueueListener の別スレッドで行い、イベントループを止めない。
+    """
+    level = os.getenv("LOG_LEVEL", "info").upper()
+    log_format = os.getenv("LOG_FORMAT", "text").lower()
+    sample_rate = int(os.getenv("LOG_SAMPLE_RATE", 1))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=TEXT_DATEFMT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
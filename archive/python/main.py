@@ -1,28 +1,66 @@
 import discord
 from discord import ui
 import os
-import threading
 import logging
 import signal
 import sys
 import asyncio
 import re
-from datetime import datetime, time, timedelta
+import socket
+import time
+from collections import Counter
+from datetime import datetime
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
-from flask import Flask
 import database as db
+from log_config import setup_logging, SAMPLED
+from health_server import start_health_server
+from metrics import register_collector, timed, measure, log_latency_summary
+from intro_cache import IntroIndex, IntroMessageCache, snapshot_message, truncate_intro_content
+from ttl_cache import TTLCache
+from voice_debounce import JoinDebouncer
+from scheduler import Scheduler, daily_at, every
+from routing import load_routing, default_route_from_env, RoutingConfigWatcher
+from send_queue import get_send_queue, all_send_queues, close_send_queues
 
 load_dotenv()
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+setup_logging()
 
 TOKEN = os.getenv("TOKEN")
+# 既定の自己紹介チャンネル・通知チャンネル（ROUTING_CONFIG_PATH の設定ファイルがない場合に使う）
 INTRODUCTION_CHANNEL_ID = 1300659373227638794
 NOTIFICATION_CHANNEL_ID = 1331177944244289598
 
+# 起動時スキャンで読み込む履歴の上限（初回のみ）と、一括保存する件数の単位
+BACKFILL_HISTORY_LIMIT = 3000
+BACKFILL_CHUNK_SIZE = 500
+
+# 自己紹介メッセージ内容のキャッシュ（件数上限と有効期限）
+INTRO_MESSAGE_CACHE_SIZE = 1024
+INTRO_MESSAGE_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+# リマインダーでの名前解決の同時実行数と1件あたりのタイムアウト秒数
+NAME_RESOLVE_CONCURRENCY = 5
+NAME_RESOLVE_TIMEOUT_SECONDS = 5
+
+# 表示名キャッシュの件数上限と有効期限（改善できなかった名前は短めに保持する）
+NAME_CACHE_SIZE = 4096
+NAME_CACHE_TTL_SECONDS = 24 * 60 * 60
+NAME_CACHE_NEGATIVE_TTL_SECONDS = 60 * 60
+
+# 同じメンバーのVC入室通知を抑制する秒数（0で無効）
+VOICE_NOTIFY_COOLDOWN_SECONDS = int(os.getenv("VOICE_NOTIFY_COOLDOWN_SECONDS", 180))
+
+# レイテンシ要約をログに出力する間隔（秒）
+LATENCY_LOG_INTERVAL_SECONDS = int(os.getenv("LATENCY_LOG_INTERVAL_SECONDS", 600))
+
+# 日次リマインダーの実行時刻とタイムゾーン
+REMINDER_TIMEZONE = ZoneInfo(os.getenv("REMINDER_TIMEZONE", "Asia/Tokyo"))
+REMINDER_HOUR = 10
+REMINDER_MINUTE = 0
+# 日次リマインダーが失敗したときに再実行するまでの秒数
+REMINDER_RETRY_SECONDS = 15 * 60
+
 # 監視するVCチャンネルID（追加分も含む）
 TARGET_VOICE_CHANNELS = [
     1300291307750559754, 1302151049368571925, 1302151154981011486,
@@ -30,32 +68,98 @@ TARGET_VOICE_CHANNELS = [
     1403273245360259163, 1404396375965433926, 1384813451813191752
 ]
 
+# 特定のbotと管理人の自己紹介を除外
+EXCLUDED_USER_IDS = [533698325203910668, 916300992612540467, 1300226846599675974]
+
+# サーバーごとのチャンネル設定ファイル（JSON）と、変更を確認する間隔（秒）
+ROUTING_CONFIG_PATH = os.getenv("ROUTING_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing.json"))
+ROUTING_RELOAD_INTERVAL_SECONDS = 60
+
 intents = discord.Intents.default()
 intents.voice_states = True
 intents.messages = True
 intents.message_content = True
 intents.members = True  # ← Dev Portal側でも「Server Members Intent」をONにしてください
-bot = discord.Bot(intents=intents)
 
-app = Flask(__name__)
+# シャーディング設定（SHARD_COUNT を指定すると AutoShardedBot で起動する）
+# SHARD_IDS でこのプロセスが担当するシャードを絞れば、複数プロセス・複数ノードに分散できる（SHARD_COUNT も必須）
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
+if SHARD_IDS and not SHARD_COUNT:
+    raise RuntimeError("❌ SHARD_IDS を指定する場合は、全体のシャード数 SHARD_COUNT も指定してください")
 
-@app.route('/')
-def home():
-    return "Self-Introduction Bot v2 is running!"
+# サーバーごとのジョブ（起動時スキャン・日次リマインダー）の担当リース
+# 同じサーバーを複数のプロセスが担当していても、リースを取れた1プロセスだけが実行する
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+JOB_LEASE_SECONDS = 600
 
-@app.route('/health')
-def health_check():
-    return "OK"
+class _ReleaseResourcesOnClose:
+    """
+    bot.run は自前のシグナルハンドラーでイベントループを止め、終了処理で close() を呼ぶ
+    （signal.signal で登録したハンドラーは呼ばれない）。そのため後片付けは close() の中で行う。
+    """
 
-def run_flask():
-    port = int(os.getenv("PORT", 8080))
-    app.run(host='0.0.0.0', port=port)
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            await release_resources()
+
+class ProfileBot(_ReleaseResourcesOnClose, discord.Bot):
+    pass
+
+class ShardedProfileBot(_ReleaseResourcesOnClose, discord.AutoShardedBot):
+    pass
+
+if SHARD_COUNT or SHARD_IDS:
+    bot = ShardedProfileBot(intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = ProfileBot(intents=intents)
+
+# (シャードID, イベント名) -> 件数（シャードごとのメトリクス用）
+shard_event_counts = Counter()
+
+# user_id -> (channel_id, message_id) のメモリ内インデックス（VC入室時にDBを引かないため）
+intro_index = IntroIndex()
+# message_id -> 組み立て済みの埋め込み（VC入室時に fetch_message を呼ばないため）
+intro_message_cache = IntroMessageCache(INTRO_MESSAGE_CACHE_SIZE, INTRO_MESSAGE_CACHE_TTL_SECONDS)
+# user_id -> 解決済みの表示名（リマインダーの名前解決でAPIを何度も呼ばないため）
+display_name_cache = TTLCache(NAME_CACHE_SIZE, NAME_CACHE_TTL_SECONDS)
+# VCを渡り歩くメンバーの入室通知をまとめて抑制する
+join_debouncer = JoinDebouncer(VOICE_NOTIFY_COOLDOWN_SECONDS)
+
+# サーバーごとのチャンネル設定（設定ファイルの変更時に丸ごと差し替える）
+DEFAULT_ROUTE = default_route_from_env(
+    INTRODUCTION_CHANNEL_ID, NOTIFICATION_CHANNEL_ID, TARGET_VOICE_CHANNELS, EXCLUDED_USER_IDS
+)
+routing = load_routing(ROUTING_CONFIG_PATH, DEFAULT_ROUTE)
+routing_watcher = RoutingConfigWatcher(ROUTING_CONFIG_PATH)
+
+# ヘルスチェック用サーバー（Botと同じイベントループ上で動く）
+health_runner = None
+# 日次リマインダーなどの定期ジョブ（1つのタスクでまとめて管理する）
+scheduler = Scheduler()
+# 日次リマインダーの定期実行と起動時の取りこぼし分が、同じプロセス内で同時に走らないようにする
+daily_reminder_lock = asyncio.Lock()
+daily_reminder_caught_up = False
+
+async def release_resources():
+    """
+    定期ジョブ・送信キュー・ヘルスチェック用サーバー・DB接続プールを片付ける（bot.close() から呼ばれる）。
+    DB接続プールは、登録された未保存の書き込み（BUMP数・クールダウンなど）を反映してから閉じる。
+    """
+    global health_runner
+    scheduler.stop()
+    close_send_queues()
+    if health_runner:
+        runner, health_runner = health_runner, None
+        await runner.cleanup()
+    await db.close_pool()
+    logging.info("✅ 終了処理完了")
 
 async def shutdown():
     logging.info("🔄 Botを終了中...")
-    await db.close_pool()
     await bot.close()
-    logging.info("✅ 終了処理完了")
 
 def signal_handler(sig, frame):
     logging.info(f"🛑 シグナル {sig} を受信しました")
@@ -84,6 +188,7 @@ async def resolve_member_display_name(member: discord.Member) -> str:
     """
     必要なときのみAPIフェッチして、できる限り“サーバーで見える名前”を返す。
     優先順: guild nick -> global display name -> display_name -> name
+    フェッチ結果は表示名キャッシュに保存し、改善できなかった名前も短めの期限で覚えておく。
     """
     # 手元にある情報で十分ならそれを返す
     nick = getattr(member, "nick", None)
@@ -95,56 +200,175 @@ async def resolve_member_display_name(member: discord.Member) -> str:
     if global_name:
         return global_name
 
-    # ここまでで display_name が name と同じ＝ID風なら、追加取得を試す
     display = getattr(member, "display_name", None)
     name = getattr(member, "name", None)
-    needs_fetch = (not nick) and (display is None or display == name)
+    fallback = display or name or f"user_{member.id}"
 
-    if needs_fetch:
-        # 1) guildキャッシュから取り直し
-        try:
-            g = member.guild
-            if g:
-                m2 = g.get_member(member.id)
-                if m2:
-                    if getattr(m2, "nick", None):
-                        return m2.nick
-                    gn2 = getattr(m2, "global_name", None)
-                    if gn2:
-                        return gn2
-                    if getattr(m2, "display_name", None) and m2.display_name != getattr(m2, "name", None):
-                        return m2.display_name
-        except Exception:
-            pass
-
-        # 2) APIでMemberをフェッチ
-        try:
-            if member.guild:
-                m3 = await member.guild.fetch_member(member.id)
-                if getattr(m3, "nick", None):
-                    return m3.nick
-                gn3 = getattr(m3, "global_name", None)
-                if gn3:
-                    return gn3
-                if getattr(m3, "display_name", None) and m3.display_name != getattr(m3, "name", None):
-                    return m3.display_name
-        except Exception:
-            pass
-
-        # 3) APIでUserをフェッチ（global display name用）
+    # ここまでで display_name が name と同じ＝ID風なら、キャッシュを見てから追加取得を試す
+    if not _needs_name_fetch(member):
+        return fallback
+
+    cached = display_name_cache.get(member.id)
+    if cached is not None:
+        return cached
+
+    fetched = await _fetch_display_name(member)
+    if fetched:
+        display_name_cache.put(member.id, fetched)
+        return fetched
+
+    # 最後の手段（取得しても改善できなかったことをネガティブキャッシュする）
+    display_name_cache.put(member.id, fallback, ttl_seconds=NAME_CACHE_NEGATIVE_TTL_SECONDS)
+    return fallback
+
+async def _fetch_display_name(member):
+    """
+    guildキャッシュ・API（Member/User）の順に取り直して表示名を探す。見つからなければ None。
+    """
+    # 1) guildキャッシュから取り直し
+    try:
+        g = member.guild
+        if g:
+            m2 = g.get_member(member.id)
+            if m2:
+                if getattr(m2, "nick", None):
+                    return m2.nick
+                gn2 = getattr(m2, "global_name", None)
+                if gn2:
+                    return gn2
+                if getattr(m2, "display_name", None) and m2.display_name != getattr(m2, "name", None):
+                    return m2.display_name
+    except Exception:
+        pass
+
+    # 2) APIでMemberをフェッチ
+    try:
+        if member.guild:
+            m3 = await member.guild.fetch_member(member.id)
+            if getattr(m3, "nick", None):
+                return m3.nick
+            gn3 = getattr(m3, "global_name", None)
+            if gn3:
+                return gn3
+            if getattr(m3, "display_name", None) and m3.display_name != getattr(m3, "name", None):
+                return m3.display_name
+    except Exception:
+        pass
+
+    # 3) APIでUserをフェッチ（global display name用）
+    try:
+        u = bot.get_user(member.id) or await bot.fetch_user(member.id)
+        if u:
+            gn = getattr(u, "global_name", None)
+            if gn:
+                return gn
+    except Exception:
+        pass
+
+    return None
+
+async def backfill_introductions(intro_channel, on_chunk=None):
+    """
+    自己紹介チャンネルの履歴を読み込み、チャンク単位でDBへ一括保存する。
+    メッセージはすべて記録し（削除時に一つ前の自己紹介に戻すため）、現在の自己紹介はDB側で投稿者ごとに最新のものを選ぶ。
+    読み込んだ最大のメッセージIDを保存し、次回以降の起動ではその続きのみを読み込む。
+    on_chunk を渡すとチャンクを保存するたびに呼ぶ（ジョブのリース延長用）。
+    戻り値は (処理したメッセージ数, 新規件数, 更新件数)。
+    """
+    cursor = await db.get_intro_scan_cursor(intro_channel.id)
+    if cursor:
+        # 前回の続きから古い順に読むので、チャンクごとに既読位置を進められる
+        logging.info(f"⏩ 前回スキャン位置 (Message ID: {cursor}) 以降の差分のみ読み込みます")
+        history = intro_channel.history(limit=None, after=discord.Object(id=cursor), oldest_first=True)
+    else:
+        history = intro_channel.history(limit=BACKFILL_HISTORY_LIMIT)
+
+    scan_count = 0
+    new_count = 0
+    update_count = 0
+    high_water_mark = cursor or 0
+    rows = []
+
+    async def flush():
+        nonlocal new_count, update_count, rows
+        if rows:
+            inserted, updated = await db.save_intros_bulk(rows)
+            new_count += inserted
+            update_count += updated
+            for user_id, channel_id, message_id, *_ in rows:
+                intro_index.put_if_newer(user_id, channel_id, message_id)
+            rows = []
+        # 新しい順に読む初回スキャンでは、途中で既読位置を進めると古いメッセージを取りこぼす
+        if cursor and high_water_mark:
+            await db.set_intro_scan_cursor(intro_channel.id, high_water_mark)
+        if on_chunk:
+            await on_chunk()
+
+    async for message in history:
+        if message.id > high_water_mark:
+            high_water_mark = message.id
+        if message.author.bot:
+            continue
+
+        scan_count += 1
+        rows.append((message.author.id, message.channel.id, message.id, *snapshot_message(message)))
+
+        if scan_count % BACKFILL_CHUNK_SIZE == 0:
+            await flush()
+            logging.info(f"📈 スキャン進捗: {scan_count}件処理完了 (新規: {new_count}, 更新: {update_count})")
+
+    await flush()
+    if not cursor and high_water_mark:
+        await db.set_intro_scan_cursor(intro_channel.id, high_water_mark)
+
+    return scan_count, new_count, update_count
+
+def _needs_name_fetch(member) -> bool:
+    """
+    手元の情報だけでは“サーバーで見える名前”が分からない（ID風の名前しかない）かどうか。
+    """
+    if getattr(member, "nick", None) or getattr(member, "global_name", None):
+        return False
+    display = getattr(member, "display_name", None)
+    return display is None or display == getattr(member, "name", None)
+
+async def resolve_member_display_names(members) -> list:
+    """
+    複数メンバーの表示名をまとめて解決する。
+    名前が不完全なメンバーはゲートウェイのチャンク要求1回でまとめて取り直し、
+    それでも足りない分だけを同時実行数とタイムアウトを制限して個別に解決する。
+    """
+    refreshed = {}
+    pending = [m for m in members if _needs_name_fetch(m)]
+    guild = pending[0].guild if pending else None
+    if guild:
         try:
-            u = bot.get_user(member.id) or await bot.fetch_user(member.id)
-            if u:
-                gn = getattr(u, "global_name", None)
-                if gn:
-                    return gn
-        except Exception:
-            pass
+            user_ids = [m.id for m in pending[:100]]
+            fetched = await asyncio.wait_for(
+                guild.query_members(user_ids=user_ids, limit=max(5, len(user_ids)), cache=True),
+                timeout=NAME_RESOLVE_TIMEOUT_SECONDS
+            )
+            refreshed = {m.id: m for m in fetched}
+        except Exception as e:
+            logging.warning(f"⚠️ メンバー情報の一括取得に失敗しました: {e}")
+
+    semaphore = asyncio.Semaphore(NAME_RESOLVE_CONCURRENCY)
 
-    # 最後の手段
-    return display or name or f"user_{member.id}"
+    async def resolve_one(member):
+        member = refreshed.get(member.id, member)
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    resolve_member_display_name(member), timeout=NAME_RESOLVE_TIMEOUT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                logging.warning(f"⚠️ 名前解決がタイムアウトしました (ID: {member.id})")
+                return get_member_display_name_fast(member)
+
+    return await asyncio.gather(*(resolve_one(m) for m in members))
 
 @bot.event
+@timed("event.on_ready")
 async def on_ready():
     logging.info(f"✅ Botがログインしました: {bot.user}")
 
@@ -163,51 +387,50 @@ async def on_ready():
         intro_count = await db.get_intro_count()
         logging.info(f"📊 現在の自己紹介データ件数: {intro_count}件")
 
-        intro_channel = bot.get_channel(INTRODUCTION_CHANNEL_ID)
-        if not intro_channel:
-            logging.error(f"❌ 自己紹介チャンネル(ID: {INTRODUCTION_CHANNEL_ID})が見つかりません！")
-            return
-
-        logging.info(f"📜 自己紹介チャンネル確認: {intro_channel.name} (ID: {intro_channel.id})")
-
-        notify_channel = bot.get_channel(NOTIFICATION_CHANNEL_ID)
-        if not notify_channel:
-            logging.error(f"❌ 通知チャンネル(ID: {NOTIFICATION_CHANNEL_ID})が見つかりません！")
-            return
-
-        logging.info(f"📢 通知チャンネル確認: {notify_channel.name} (ID: {notify_channel.id})")
-
-        logging.info("🔍 過去の自己紹介をスキャン開始...")
-        scan_count = 0
-        new_count = 0
-        update_count = 0
+        global routing
+        routing = routing.resolve_guild_ids(bot.get_channel)
 
-        try:
-            async for message in intro_channel.history(limit=3000):
-                if not message.author.bot:
-                    scan_count += 1
-                    try:
-                        existing_intro = await db.get_intro_ids(message.author.id)
-                        if existing_intro:
-                            update_count += 1
-                            logging.debug(f"🔄 更新: {get_member_display_name_fast(message.author)} (ID: {message.author.id})")
-                        else:
-                            new_count += 1
-                            logging.info(f"🆕 新規: {get_member_display_name_fast(message.author)} (ID: {message.author.id})")
+        for route in routing.routes:
+            intro_channel = bot.get_channel(route.intro_channel_id)
+            if not intro_channel:
+                if route.guild_id and bot.get_guild(route.guild_id) is None:
+                    logging.info(f"⏭️ サーバー(ID: {route.guild_id})はこのプロセスの担当シャードではないため、スキャンをスキップします")
+                else:
+                    logging.error(f"❌ 自己紹介チャンネル(ID: {route.intro_channel_id})が見つかりません！")
+                continue
 
-                        await db.save_intro(message.author.id, message.channel.id, message.id)
+            logging.info(f"📜 自己紹介チャンネル確認: {intro_channel.name} (ID: {intro_channel.id})")
 
-                        if scan_count % 100 == 0:
-                            logging.info(f"📈 スキャン進捗: {scan_count}件処理完了 (新規: {new_count}, 更新: {update_count})")
+            notify_channel = bot.get_channel(route.notify_channel_id)
+            if not notify_channel:
+                logging.error(f"❌ 通知チャンネル(ID: {route.notify_channel_id})が見つかりません！")
+                continue
 
-                    except Exception as save_error:
-                        logging.error(f"❌ メッセージ保存エラー (Message ID: {message.id}): {save_error}")
+            logging.info(f"📢 通知チャンネル確認: {notify_channel.name} (ID: {notify_channel.id})")
 
-            logging.info(f"🎉 スキャン完了！")
-            logging.info(f"  📊 総処理数: {scan_count}件")
-            logging.info(f"  🆕 新規追加: {new_count}件")
-            logging.info(f"  🔄 更新: {update_count}件")
+            claimed = False
+            try:
+                claimed = await claim_guild_job("intro_backfill", intro_channel.guild.id)
+                if not claimed:
+                    continue
+
+                logging.info("🔍 過去の自己紹介をスキャン開始...")
+                scan_count, new_count, update_count = await backfill_introductions(
+                    intro_channel, on_chunk=guild_job_renewer("intro_backfill", intro_channel.guild.id)
+                )
+
+                logging.info(f"🎉 スキャン完了！")
+                logging.info(f"  📊 総処理数: {scan_count}件")
+                logging.info(f"  🆕 新規追加: {new_count}件")
+                logging.info(f"  🔄 更新: {update_count}件")
+
+            except Exception as scan_error:
+                logging.error(f"❌ メッセージスキャン中にエラー: {scan_error}", exc_info=True)
+            finally:
+                if claimed:
+                    await release_guild_job("intro_backfill", intro_channel.guild.id)
 
+        try:
             final_count = await db.get_intro_count()
             logging.info(f"📊 最終DB内自己紹介件数: {final_count}件")
 
@@ -216,12 +439,23 @@ async def on_ready():
                 logging.info("📝 最新の自己紹介サンプル:")
                 for intro in recent_intros:
                     logging.info(f"  User: {intro['user_id']}, Channel: {intro['channel_id']}, Message: {intro['message_id']}")
+        except Exception as e:
+            logging.error(f"❌ 自己紹介件数の確認中にエラー: {e}", exc_info=True)
+
+        # インデックスは起動時に一度だけ読み込む（再接続時はスキャン結果を反映済みの内容をそのまま使う）
+        try:
+            await intro_index.ensure_loaded()
+        except Exception as index_error:
+            logging.error(f"❌ 自己紹介インデックスの読み込みに失敗しました: {index_error}", exc_info=True)
 
-        except Exception as scan_error:
-            logging.error(f"❌ メッセージスキャン中にエラー: {scan_error}", exc_info=True)
+        # 日次リマインダーなどの定期ジョブを開始（再接続時は既存のタスクをそのまま使う）
+        await scheduler.start()
 
-        # 日次リマインダータスクを開始
-        asyncio.create_task(daily_reminder_task())
+        # scheduled_jobs の次回実行時刻は全プロセスで共有なので、取りこぼしはサーバーごとに判断する
+        global daily_reminder_caught_up
+        if not daily_reminder_caught_up:
+            daily_reminder_caught_up = True
+            asyncio.create_task(catch_up_daily_reminders())
 
         logging.info("✅ Bot初期化完了！入室監視を開始します。")
 
@@ -229,63 +463,162 @@ async def on_ready():
         logging.error(f"❌ 起動処理中にエラー: {e}", exc_info=True)
 
 @bot.event
+@timed("event.on_message")
 async def on_message(message):
-    if message.channel.id == INTRODUCTION_CHANNEL_ID and not message.author.bot:
+    if routing.for_intro_channel(message.channel.id) and not message.author.bot:
         try:
-            await db.save_intro(message.author.id, message.channel.id, message.id)
-            logging.info(f"📝 {get_member_display_name_fast(message.author)} の新しい自己紹介をDBに保存しました")
+            inserted = await db.save_intro(
+                message.author.id, message.channel.id, message.id, *snapshot_message(message)
+            )
+            intro_index.put(message.author.id, message.channel.id, message.id)
+            intro_message_cache.put_message(message)
+            shard_event_counts[(message.guild.shard_id, "intro_saved")] += 1
+            action = "保存" if inserted else "更新"
+            logging.info(f"📝 {get_member_display_name_fast(message.author)} の自己紹介をDBに{action}しました")
         except Exception as e:
             logging.error(f"❌ on_messageでのDB保存中にエラー: {e}", exc_info=True)
 
 @bot.event
+@timed("event.on_member_update")
+async def on_member_update(before, after):
+    # ニックネームや表示名が変わったら、ゲートウェイの情報で表示名キャッシュを更新する
+    name = getattr(after, "nick", None) or getattr(after, "global_name", None)
+    if name:
+        display_name_cache.put(after.id, name)
+    else:
+        display_name_cache.pop(after.id)
+
+@bot.event
+@timed("event.on_user_update")
+async def on_user_update(before, after):
+    if getattr(before, "global_name", None) != getattr(after, "global_name", None):
+        display_name_cache.pop(after.id)
+
+@bot.event
+@timed("event.on_raw_message_edit")
+async def on_raw_message_edit(payload):
+    if routing.for_intro_channel(payload.channel_id):
+        intro_message_cache.invalidate(payload.message_id)
+        # 本文が変わった編集なら、VC入室通知に使うスナップショットも更新する
+        content = payload.data.get("content")
+        if content is not None:
+            content = truncate_intro_content(content)
+        try:
+            if await db.mark_intro_message_edited(payload.message_id, content):
+                logging.info(f"✏️ 自己紹介メッセージ (ID: {payload.message_id}) の編集を記録しました")
+        except Exception as e:
+            logging.error(f"❌ 自己紹介の編集の記録中にエラー: {e}", exc_info=True)
+
+@bot.event
+@timed("event.on_raw_message_delete")
+async def on_raw_message_delete(payload):
+    if routing.for_intro_channel(payload.channel_id):
+        await apply_intro_deletions([payload.message_id])
+
+@bot.event
+@timed("event.on_raw_bulk_message_delete")
+async def on_raw_bulk_message_delete(payload):
+    if routing.for_intro_channel(payload.channel_id):
+        await apply_intro_deletions(payload.message_ids)
+
+async def apply_intro_deletions(message_ids):
+    """
+    削除された自己紹介メッセージをDB・インデックス・キャッシュに反映する。
+    削除されたのが現在の自己紹介なら、一つ前の自己紹介に戻す。
+    """
+    for message_id in message_ids:
+        intro_message_cache.invalidate(message_id)
+    try:
+        changes = await db.delete_intro_messages(message_ids)
+    except Exception as e:
+        logging.error(f"❌ 自己紹介の削除の反映中にエラー: {e}", exc_info=True)
+        return
+    for (channel_id, user_id), message_id in changes.items():
+        if message_id:
+            intro_index.put(user_id, channel_id, message_id)
+            logging.info(f"↩️ User {user_id} の自己紹介が削除されたため、以前の自己紹介 (Message ID: {message_id}) に戻しました")
+        else:
+            intro_index.discard(user_id, channel_id)
+            logging.info(f"🗑️ User {user_id} の自己紹介が削除されました（以前の自己紹介はありません）")
+
+@bot.event
+@timed("event.on_voice_state_update")
 async def on_voice_state_update(member, before, after):
-    # 特定のbotと管理人の自己紹介を除外
-    excluded_bot_ids = [533698325203910668, 916300992612540467, 1300226846599675974]
+    if before.channel == after.channel or not after.channel:
+        return
+    route = routing.for_voice_channel(after.channel.id)
+    if route:
 
-    if (before.channel != after.channel and
-        after.channel and
-        after.channel.id in TARGET_VOICE_CHANNELS):
+        if member.id in route.excluded_user_ids:
+            logging.debug("🤖 除外対象bot %s (ID: %s) がボイスチャンネル '%s' に参加しましたが、自己紹介通知をスキップします", member.display_name, member.id, after.channel.name)
+            return
 
-        if member.id in excluded_bot_ids:
-            logging.info(f"🤖 除外対象bot {member.display_name} (ID: {member.id}) がボイスチャンネル '{after.channel.name}' に参加しましたが、自己紹介通知をスキップします")
+        if not join_debouncer.should_notify(after.channel.guild.id, member.id):
+            logging.info("⏳ %s (ID: %s) は%s秒以内に通知済みのため、入室通知をスキップします (累計抑制: %s件)", member.display_name, member.id, VOICE_NOTIFY_COOLDOWN_SECONDS, join_debouncer.dropped, extra=SAMPLED)
             return
+        shard_event_counts[(after.channel.guild.shard_id, "voice_join")] += 1
 
-        # デバッグ出力
-        logging.info(f"🔍 名前情報詳細 (ID: {member.id}):")
-        logging.info(f"  - Nick: {repr(getattr(member, 'nick', None))}")
-        logging.info(f"  - Global Name (attr有無): {hasattr(member, 'global_name')}")
-        logging.info(f"  - Username: {repr(getattr(member, 'name', None))}")
-        logging.info(f"  - Display Name: {repr(getattr(member, 'display_name', None))}")
+        # デバッグ出力（DEBUGレベルが有効なときだけ組み立てる）
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(
+                "🔍 名前情報詳細 (ID: %s): Nick=%r, Global Name (attr有無)=%s, Username=%r, Display Name=%r",
+                member.id, getattr(member, 'nick', None), hasattr(member, 'global_name'),
+                getattr(member, 'name', None), getattr(member, 'display_name', None)
+            )
 
-        logging.info(f"🔊 使用される名前(解決後): {member.display_name} (ID: {member.id}) がボイスチャンネル '{after.channel.name}' に参加しました")
+        logging.info("🔊 %s (ID: %s) がボイスチャンネル '%s' に参加しました", member.display_name, member.id, after.channel.name, extra=SAMPLED)
 
-        notify_channel = bot.get_channel(NOTIFICATION_CHANNEL_ID)
+        notify_channel = bot.get_channel(route.notify_channel_id)
         if not notify_channel:
-            logging.error(f"❌ 通知チャンネル(ID: {NOTIFICATION_CHANNEL_ID})が見つかりません")
+            logging.error("❌ 通知チャンネル(ID: %s)が見つかりません", route.notify_channel_id)
             return
+        send_queue = get_send_queue(notify_channel)
 
         try:
-            logging.info(f"🔍 {member.display_name} の自己紹介を検索中...")
-            intro_ids = await db.get_intro_ids(member.id)
+            logging.debug("🔍 %s の自己紹介を検索中...", member.display_name)
+            # 別のサーバーの自己紹介チャンネルに投稿されたものは、このサーバーでは表示しない
+            intro_ids = await intro_index.lookup(member.id, route.intro_channel_id)
 
             if intro_ids:
-                logging.info(f"✅ 自己紹介発見: Channel {intro_ids['channel_id']}, Message {intro_ids['message_id']}")
+                intro_channel_id, intro_message_id = intro_ids
+                logging.debug("✅ 自己紹介発見: Channel %s, Message %s", intro_channel_id, intro_message_id)
 
                 try:
-                    intro_channel = bot.get_channel(intro_ids['channel_id'])
-                    if not intro_channel:
-                        logging.error(f"❌ 自己紹介チャンネル(ID: {intro_ids['channel_id']})が取得できません")
-                        raise Exception("チャンネル取得失敗")
-
-                    intro_message = await intro_channel.fetch_message(intro_ids['message_id'])
-                    logging.info(f"✅ 自己紹介メッセージ取得成功 (長さ: {len(intro_message.content)}文字)")
-
-                    embed = discord.Embed(
-                        description=intro_message.content,
-                        color=discord.Color.blue()
-                    )
+                    cached = intro_message_cache.get(intro_message_id)
+                    if cached:
+                        logging.debug("✅ 自己紹介メッセージをキャッシュから取得")
+                    else:
+                        # DBに保存した本文のスナップショットがあれば、Discord APIを呼ばずに組み立てる
+                        snapshot = await db.get_intro_snapshot(member.id, intro_channel_id)
+                        if (snapshot and snapshot['message_id'] == intro_message_id
+                                and snapshot['content'] is not None and snapshot['jump_url']):
+                            logging.debug("✅ 自己紹介をDBのスナップショットから取得")
+                            cached = intro_message_cache.put_snapshot(
+                                intro_message_id, snapshot['content'], snapshot['jump_url']
+                            )
+                        else:
+                            intro_channel = bot.get_channel(intro_channel_id)
+                            if not intro_channel:
+                                logging.error("❌ 自己紹介チャンネル(ID: %s)が取得できません", intro_channel_id)
+                                raise Exception("チャンネル取得失敗")
+
+                            with measure("discord.fetch_message"):
+                                intro_message = await intro_channel.fetch_message(intro_message_id)
+                            logging.debug("✅ 自己紹介メッセージ取得成功 (長さ: %s文字)", len(intro_message.content))
+                            cached = intro_message_cache.put_message(intro_message)
+                            # スナップショットを保存する前の自己紹介は、取得したついでに保存しておく
+                            try:
+                                await db.save_intro_snapshot(
+                                    member.id, intro_channel_id, intro_message_id, *snapshot_message(intro_message)
+                                )
+                            except Exception as snapshot_error:
+                                logging.error("❌ 自己紹介スナップショットの保存中にエラー: %s", snapshot_error)
+
+                    embed_payload, jump_url = cached
+                    embed = discord.Embed.from_dict(embed_payload)
                     embed.set_author(
                         name=f"{member.display_name}さんの自己紹介",
+                        url=jump_url,
                         icon_url=member.display_avatar.url
                     )
 
@@ -293,112 +626,193 @@ async def on_voice_state_update(member, before, after):
                     button = ui.Button(
                         label="元の自己紹介へ移動",
                         style=discord.ButtonStyle.link,
-                        url=intro_message.jump_url
+                        url=jump_url
                     )
                     view.add_item(button)
 
-                    await notify_channel.send(
+                    send_queue.enqueue(
                         f"**{member.display_name}** さんが `{after.channel.name}` に入室しました！",
                         embed=embed,
-                        view=view
+                        view=view,
+                        mergeable=True
                     )
-                    logging.info("✅ 自己紹介付き通知を送信しました")
+                    logging.debug("✅ 自己紹介付き通知を送信キューに追加しました")
 
                 except discord.NotFound:
-                    logging.warning(f"⚠️ {member.display_name} の自己紹介メッセージが見つかりません（削除済み?）")
+                    logging.warning("⚠️ %s の自己紹介メッセージが見つかりません（削除済み?）", member.display_name)
+                    # 削除イベントを取りこぼしていた場合に備え、次回からは以前の自己紹介を使う
+                    await apply_intro_deletions([intro_message_id])
                     msg = f"**{member.display_name}** さんが `{after.channel.name}` に入室しました！\n⚠️ この方の自己紹介メッセージが削除されているようです。"
-                    await notify_channel.send(msg)
-                    logging.info("✅ 自己紹介なし通知（削除済み）を送信しました")
+                    send_queue.enqueue(msg, mergeable=True)
+                    logging.debug("✅ 自己紹介なし通知（削除済み）を送信キューに追加しました")
 
                 except Exception as fetch_error:
-                    logging.error(f"❌ 自己紹介メッセージ取得エラー: {fetch_error}")
+                    logging.error("❌ 自己紹介メッセージ取得エラー: %s", fetch_error)
                     msg = f"**{member.display_name}** さんが `{after.channel.name}` に入室しました！\n⚠️ 自己紹介の取得中にエラーが発生しました。"
-                    await notify_channel.send(msg)
-                    logging.info("✅ エラー時代替通知を送信しました")
+                    send_queue.enqueue(msg, mergeable=True)
+                    logging.debug("✅ エラー時代替通知を送信キューに追加しました")
             else:
-                logging.info(f"❌ {member.display_name} の自己紹介がDBに見つかりません")
+                logging.info("❌ %s の自己紹介がDBに見つかりません", member.display_name, extra=SAMPLED)
                 msg = f"**{member.display_name}** さんが `{after.channel.name}` に入室しました！\n⚠️ この方の自己紹介はまだ投稿されていないか、見つかりませんでした。"
-                await notify_channel.send(msg)
-                logging.info("✅ 自己紹介なし通知を送信しました")
+                send_queue.enqueue(msg, mergeable=True)
+                logging.debug("✅ 自己紹介なし通知を送信キューに追加しました")
 
         except Exception as e:
-            logging.error(f"❌ 通知処理中にエラー: {e}", exc_info=True)
+            logging.error("❌ 通知処理中にエラー: %s", e, exc_info=True)
             try:
                 msg = f"**{member.display_name}** さんが `{after.channel.name}` に入室しました！"
-                await notify_channel.send(msg)
-                logging.info("✅ 最低限の入室通知を送信しました")
+                send_queue.enqueue(msg, mergeable=True)
+                logging.debug("✅ 最低限の入室通知を送信キューに追加しました")
             except Exception as fallback_error:
-                logging.error(f"❌ 代替通知送信も失敗: {fallback_error}")
+                logging.error("❌ 代替通知送信も失敗: %s", fallback_error)
 
-async def daily_reminder_task():
+async def claim_guild_job(name, guild_id):
     """
-    毎日決まった時間（午前10時）に自己紹介未投稿のメンバーにお知らせを送信する。
+    サーバーごとのジョブの担当リースを取る。他のプロセスが実行中なら False。
     """
-    while True:
-        try:
-            now = datetime.now()
-            target_time = time(10, 0)  # 10:00 AM
-            target_datetime = datetime.combine(now.date(), target_time)
-            if now.time() > target_time:
-                target_datetime += timedelta(days=1)
-            sleep_seconds = (target_datetime - now).total_seconds()
-            logging.info(f"⏰ 次回自己紹介リマインダー実行: {target_datetime} ({sleep_seconds:.0f}秒後)")
-            await asyncio.sleep(sleep_seconds)
-
-            result = await send_intro_reminder()
-            logging.info(result)
+    if await db.try_acquire_job_lease(name, guild_id, WORKER_ID, JOB_LEASE_SECONDS):
+        return True
+    logging.info(f"⏭️ ジョブ {name} (サーバーID: {guild_id}) は他のプロセスが実行中のため、スキップします")
+    return False
 
-        except Exception as e:
-            logging.error(f"❌ 日次リマインダー処理中にエラー: {e}", exc_info=True)
-            await asyncio.sleep(3600)
+def guild_job_renewer(name, guild_id):
+    """
+    長いジョブの途中で呼ぶための、リースを延長する関数を返す。
+    DBへの問い合わせはリース期間の1/3が過ぎるごとに1回だけ。他のプロセスに取られていたら例外で中断させる。
+    """
+    renewed_at = time.monotonic()
+
+    async def renew():
+        nonlocal renewed_at
+        if time.monotonic() - renewed_at < JOB_LEASE_SECONDS / 3:
+            return
+        if not await db.try_acquire_job_lease(name, guild_id, WORKER_ID, JOB_LEASE_SECONDS):
+            raise RuntimeError(f"ジョブ {name} (サーバーID: {guild_id}) のリースが他のプロセスに移ったため中断します")
+        renewed_at = time.monotonic()
+
+    return renew
+
+async def release_guild_job(name, guild_id):
+    try:
+        await db.release_job_lease(name, guild_id, WORKER_ID)
+    except Exception as e:
+        logging.error(f"❌ ジョブ {name} のリース解放中にエラー: {e}")
+
+async def run_daily_reminder():
+    """
+    毎日決まった時間（午前10時）に各サーバーの自己紹介未投稿のメンバーにお知らせを送信する。
+    このプロセスのシャードにいるサーバーだけを対象にし、リースを取れた場合だけ送信する。
+    失敗したサーバーがあれば例外にして、スケジューラーに再実行させる（送信済みのサーバーはスキップされる）。
+    """
+    async with daily_reminder_lock:
+        failures = []
+        for route in routing.routes:
+            if not route.guild_id or bot.get_guild(route.guild_id) is None:
+                continue
+            if not await claim_guild_job("daily_intro_reminder", route.guild_id):
+                continue
+            try:
+                result = await send_intro_reminder(route)
+            finally:
+                await release_guild_job("daily_intro_reminder", route.guild_id)
+            logging.info(result)
+            if result.startswith("❌"):
+                failures.append(result)
+        if failures:
+            raise RuntimeError(" / ".join(failures))
 
-async def send_intro_reminder(force=False):
+async def catch_up_daily_reminders():
     """
-    自己紹介リマインダーを送信する共通関数
+    起動時に今日のリマインダー時刻を過ぎていれば、このプロセスが担当するサーバーのうち
+    今日まだ送っていないサーバー（daily_reminder_log に今日の行がないサーバー）に送る。
+    他のシャードのプロセスが今日の分を実行して scheduled_jobs を明日に進めていても、
+    停止中だったこのプロセスのサーバーが取りこぼされないようにする。
     """
+    now = datetime.now(REMINDER_TIMEZONE)
+    if now < now.replace(hour=REMINDER_HOUR, minute=REMINDER_MINUTE, second=0, microsecond=0):
+        return
+    logging.info("⏰ 今日のリマインダー時刻を過ぎているため、未送信のサーバーを確認します")
     try:
-        if not force and await db.check_daily_reminder_sent():
-            return "📅 今日は既にリマインダーを送信済みです"
+        await run_daily_reminder()
+    except Exception as e:
+        logging.error(f"❌ 取りこぼした日次リマインダーの送信中にエラー: {e}", exc_info=True)
 
-        intro_channel = bot.get_channel(INTRODUCTION_CHANNEL_ID)
+async def reload_routing_if_changed():
+    """
+    ルーティング設定ファイルが変更されていれば読み込み直す（再起動は不要）。
+    """
+    global routing
+    if routing_watcher.changed():
+        routing = load_routing(ROUTING_CONFIG_PATH, DEFAULT_ROUTE).resolve_guild_ids(bot.get_channel)
+        logging.info(f"🔄 ルーティング設定を再読み込みしました ({len(routing.routes)}サーバー)")
+
+async def log_latency_summary_job():
+    log_latency_summary()
+
+scheduler.add_job(
+    "daily_intro_reminder", run_daily_reminder,
+    daily_at(REMINDER_HOUR, REMINDER_MINUTE, REMINDER_TIMEZONE),
+    persist=True, retry_delay=REMINDER_RETRY_SECONDS
+)
+scheduler.add_job("latency_summary", log_latency_summary_job, every(LATENCY_LOG_INTERVAL_SECONDS))
+scheduler.add_job("routing_reload", reload_routing_if_changed, every(ROUTING_RELOAD_INTERVAL_SECONDS))
+
+@timed("reminder.send_intro_reminder")
+async def send_intro_reminder(route, force=False):
+    """
+    自己紹介リマインダーを送信する共通関数（1サーバー分）
+    """
+    try:
+        intro_channel = bot.get_channel(route.intro_channel_id)
         if not intro_channel:
-            return f"❌ 自己紹介チャンネル(ID: {INTRODUCTION_CHANNEL_ID})が見つかりません"
+            return f"❌ 自己紹介チャンネル(ID: {route.intro_channel_id})が見つかりません"
 
-        notify_channel = bot.get_channel(NOTIFICATION_CHANNEL_ID)
+        notify_channel = bot.get_channel(route.notify_channel_id)
         if not notify_channel:
-            return f"❌ 通知チャンネル(ID: {NOTIFICATION_CHANNEL_ID})が見つかりません"
+            return f"❌ 通知チャンネル(ID: {route.notify_channel_id})が見つかりません"
 
         guild = intro_channel.guild
-
-        members_without_intro = await db.get_members_without_intro(guild.members)
-        if not members_without_intro:
+        today = datetime.now(REMINDER_TIMEZONE).date()
+        if not force and await db.check_daily_reminder_sent(today, guild.id):
+            return f"📅 今日は既にリマインダーを送信済みです ({guild.name})"
+
+        # DBの全件スキャンはせず、メモリ内インデックスとサーバーメンバーの差分を取る
+        await intro_index.ensure_loaded()
+        total, first_ten, missing_ids = intro_index.find_members_without_intro(
+            guild.members, 10, route.intro_channel_id
+        )
+        if not total:
             if not force:
-                await db.log_daily_reminder([])
+                await db.sync_reminder_recipients([], guild.id)
+                await db.log_daily_reminder(0, [], today, guild.id)
             return "🎉 全メンバーが自己紹介済みです！"
 
-        # 名前解決（必要に応じてフェッチ）
-        first_ten = members_without_intro[:10]
-        member_names = []
-        for m in first_ten:
-            member_names.append(await resolve_member_display_name(m))
+        # 前回のリマインダー以降に対象者になった人を先に表示する（対象から外れた人はここで削除される）
+        new_ids = await db.sync_reminder_recipients(missing_ids, guild.id)
+        newcomers = [m for m in (guild.get_member(user_id) for user_id in new_ids[:10]) if m]
+        newcomer_ids = {m.id for m in newcomers}
+        display_members = (newcomers + [m for m in first_ten if m.id not in newcomer_ids])[:10]
+
+        # 名前解決（必要に応じてまとめてフェッチ）
+        member_names = await resolve_member_display_names(display_members)
 
         message_content = "🌟 **自己紹介のお知らせ** 🌟\n\n"
-        if len(members_without_intro) > 10:
-            message_content += f"**{', '.join(member_names)} ほか{len(members_without_intro) - 10}名の皆さん**\n\n"
+        if total > 10:
+            message_content += f"**{', '.join(member_names)} ほか{total - 10}名の皆さん**\n\n"
         else:
             message_content += f"**{', '.join(member_names)} の皆さん**\n\n"
 
-        message_content += f"こんにちは！<#{INTRODUCTION_CHANNEL_ID}> チャンネルでの自己紹介をお待ちしています！\n"
+        message_content += f"こんにちは！<#{route.intro_channel_id}> チャンネルでの自己紹介をお待ちしています！\n"
         message_content += "書ける範囲で構いませんので、あなたのことを教えてください 😊\n"
         message_content += "趣味、好きなこと、最近気になっていることなど、何でも大丈夫です！"
 
-        await notify_channel.send(message_content)
+        if not await get_send_queue(notify_channel).enqueue(message_content):
+            return "❌ リマインダーの送信に失敗しました"
 
         if not force:
-            notified_user_ids = [str(member.id) for member in members_without_intro]
-            await db.log_daily_reminder(notified_user_ids)
+            await db.log_daily_reminder(total, new_ids, today, guild.id)
 
-        return f"✅ 自己紹介リマインダーを送信しました ({len(members_without_intro)}名対象)"
+        return f"✅ 自己紹介リマインダーを送信しました ({total}名対象、うち新規{len(new_ids)}名)"
 
     except Exception as e:
         logging.error(f"❌ リマインダー送信中にエラー: {e}", exc_info=True)
@@ -411,7 +825,13 @@ async def profilebot_command(ctx):
     """
     await ctx.defer(ephemeral=True)  # 非公開レスポンス
     try:
-        result = await send_intro_reminder(force=True)
+        route = routing.for_guild(ctx.guild_id) if ctx.guild_id else None
+        if route is None and len(routing.routes) == 1:
+            route = routing.routes[0]
+        if route is None:
+            await ctx.followup.send("❌ このサーバーのチャンネル設定が見つかりません", ephemeral=True)
+            return
+        result = await send_intro_reminder(route, force=True)
         await ctx.followup.send(f"🔄 **プロフィールリマインダー実行結果**\n{result}", ephemeral=True)
         logging.info(f"✅ /profilebot コマンドが実行されました - 結果: {result}")
     except Exception as e:
@@ -419,7 +839,67 @@ async def profilebot_command(ctx):
         await ctx.followup.send(error_msg, ephemeral=True)
         logging.error(f"❌ /profilebot コマンド実行エラー: {e}", exc_info=True)
 
+@register_collector
+def collect_bot_metrics():
+    yield ("profilebot_gateway_latency_seconds", "gauge", "Discordゲートウェイのレイテンシ",
+           [({}, bot.latency)])
+
+    # シャードごとのレイテンシ・サーバー数・メンバー数・イベント数
+    shard_latencies = bot.latencies if isinstance(bot, discord.AutoShardedBot) else [(0, bot.latency)]
+    shard_guilds = Counter()
+    shard_members = Counter()
+    for guild in bot.guilds:
+        shard_guilds[guild.shard_id] += 1
+        shard_members[guild.shard_id] += guild.member_count or 0
+    yield ("profilebot_shard_latency_seconds", "gauge", "シャードごとのゲートウェイのレイテンシ",
+           [({"shard": shard_id}, latency) for shard_id, latency in shard_latencies])
+    yield ("profilebot_shard_guilds", "gauge", "シャードごとのサーバー数",
+           [({"shard": shard_id}, count) for shard_id, count in shard_guilds.items()])
+    yield ("profilebot_shard_members", "gauge", "シャードごとのメンバー数",
+           [({"shard": shard_id}, count) for shard_id, count in shard_members.items()])
+    yield ("profilebot_shard_events_total", "counter", "シャードごとに処理したイベント数",
+           [({"shard": shard_id, "event": event}, count)
+            for (shard_id, event), count in shard_event_counts.items()])
+
+    caches = {
+        "intro_index": intro_index.stats(),
+        "intro_message": intro_message_cache.stats(),
+        "display_name": display_name_cache.stats(),
+    }
+    yield ("profilebot_cache_entries", "gauge", "キャッシュの件数",
+           [({"cache": name}, stats["entries"]) for name, stats in caches.items()])
+    yield ("profilebot_cache_hits_total", "counter", "キャッシュのヒット数",
+           [({"cache": name}, stats["hits"]) for name, stats in caches.items()])
+    yield ("profilebot_cache_misses_total", "counter", "キャッシュのミス数",
+           [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+
+    debounce = join_debouncer.stats()
+    yield ("profilebot_voice_notifications_total", "counter", "VC入室通知の判定結果",
+           [({"result": "allowed"}, debounce["allowed"]), ({"result": "dropped"}, debounce["dropped"])])
+
+    queues = all_send_queues()
+    yield ("profilebot_send_queue_depth", "gauge", "送信待ちのメッセージ数",
+           [({"channel": channel_id}, q.stats()["depth"]) for channel_id, q in queues.items()])
+    yield ("profilebot_send_queue_sent_messages_total", "counter", "送信したメッセージ数",
+           [({"channel": channel_id}, q.stats()["sent_messages"]) for channel_id, q in queues.items()])
+    yield ("profilebot_send_queue_merged_items_total", "counter", "まとめて送信した通知数",
+           [({"channel": channel_id}, q.stats()["merged_items"]) for channel_id, q in queues.items()])
+    yield ("profilebot_send_queue_failed_items_total", "counter", "送信に失敗した通知数",
+           [({"channel": channel_id}, q.stats()["failed_items"]) for channel_id, q in queues.items()])
+    yield ("profilebot_send_queue_latency_seconds", "gauge", "キュー投入から送信完了までの時間",
+           [({"channel": channel_id, "stat": stat}, q.stats()[f"{stat}_latency_seconds"])
+            for channel_id, q in queues.items() for stat in ("last", "avg", "max")])
+
+    pool_stats = db.get_pool_stats()
+    if pool_stats:
+        yield ("profilebot_db_pool_connections", "gauge", "DB接続プールの接続数",
+               [({"state": "open"}, pool_stats["size"]), ({"state": "idle"}, pool_stats["idle"]),
+                ({"state": "in_use"}, pool_stats["in_use"]), ({"state": "max"}, pool_stats["max_size"])])
+        yield ("profilebot_db_pool_saturation", "gauge", "使用中の接続数 / 最大接続数",
+               [({}, pool_stats["saturation"])])
+
 def main():
+    global health_runner
     if not TOKEN:
         logging.error("❌ TOKENが設定されていません！")
         return
@@ -428,9 +908,14 @@ def main():
         logging.error("❌ DATABASE_URLが設定されていません！")
         return
 
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    logging.info("✅ Webサーバーを開始しました")
+    try:
+        bot.loop.run_until_complete(db.warm_up_pool())
+    except Exception as e:
+        logging.error(f"❌ DB接続プールの準備に失敗しました: {e}")
+
+    port = int(os.getenv("PORT", 8080))
+    health_runner = bot.loop.run_until_complete(start_health_server(bot, port))
+    logging.info(f"✅ Webサーバーを開始しました (port: {port})")
 
     logging.info("🚀 Botを開始します...")
     try:
@@ -0,0 +1,164 @@
+import functools
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 登録された収集関数の一覧。各関数は (名前, 種類, 説明, [(ラベル辞書, 値), ...]) を返す。
+_collectors = []
+
+def register_collector(collect):
+    """
+    /metrics で出力するメトリクスの収集関数を登録する。
+    """
+    _collectors.append(collect)
+    return collect
+
+def _format_value(value):
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+def render_prometheus():
+    """
+    登録済みのメトリクスをPrometheusのテキスト形式で返す。
+    """
+    lines = []
+    for collect in _collectors:
+        try:
+            families = list(collect())
+        except Exception as e:
+            logging.error(f"❌ メトリクス収集中にエラー ({collect.__name__}): {e}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+class LatencyStats:
+    """
+    1つの処理の所要時間の記録。
+    パーセンタイルは直近 window 件のサンプルから計算する。
+    """
+
+    def __init__(self, window=1024):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+    def observe(self, seconds, error=False):
+        self._samples.append(seconds)
+        self.count += 1
+        self.total_seconds += seconds
+        if error:
+            self.errors += 1
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        if not self._samples:
+            return {q: 0.0 for q in quantiles}
+        ordered = sorted(self._samples)
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in quantiles}
+
+# 処理名 -> LatencyStats
+_latencies = {}
+
+def observe_latency(name, seconds, error=False):
+    stats = _latencies.get(name)
+    if stats is None:
+        stats = _latencies[name] = LatencyStats()
+    stats.observe(seconds, error)
+
+@contextmanager
+def measure(name):
+    """
+    with ブロックの所要時間を name の処理として記録する。例外が出た場合はエラーとして数える。
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        observe_latency(name, time.perf_counter() - start, error)
+
+def timed(name=None):
+    """
+    非同期関数の所要時間・回数・エラー数を記録するデコレーター。
+    name を省略した場合は関数名を使う。
+    """
+    def decorator(func):
+        op_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with measure(op_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def latency_snapshot():
+    """
+    処理名ごとの回数・エラー数・パーセンタイル（秒）を返す。
+    """
+    snapshot = {}
+    for name, stats in _latencies.items():
+        p = stats.percentiles()
+        snapshot[name] = {
+            "count": stats.count,
+            "errors": stats.errors,
+            "p50": p[0.5],
+            "p95": p[0.95],
+            "p99": p[0.99],
+        }
+    return snapshot
+
+def log_latency_summary():
+    """
+    処理ごとのレイテンシの要約をログに出力する。
+    """
+    snapshot = latency_snapshot()
+    if not snapshot:
+        return
+    logging.info("⏱️ レイテンシ要約 (p50 / p95 / p99, 件数, エラー):")
+    for name in sorted(snapshot):
+        s = snapshot[name]
+        logging.info(
+            "  %s: %.1fms / %.1fms / %.1fms, %d件, エラー%d件",
+            name, s["p50"] * 1000, s["p95"] * 1000, s["p99"] * 1000, s["count"], s["errors"]
+        )
+
+@register_collector
+def collect_latency_metrics():
+    samples = []
+    counts = []
+    sums = []
+    errors = []
+    for name, stats in _latencies.items():
+        for q, value in stats.percentiles().items():
+            samples.append(({"operation": name, "quantile": q}, value))
+        counts.append(({"operation": name}, stats.count))
+        sums.append(({"operation": name}, stats.total_seconds))
+        errors.append(({"operation": name}, stats.errors))
+    yield ("profilebot_operation_latency_seconds", "gauge", "処理ごとのレイテンシ（直近サンプルのパーセンタイル）", samples)
+    yield ("profilebot_operation_duration_seconds_sum", "counter", "処理ごとの合計所要時間", sums)
+    yield ("profilebot_operation_calls_total", "counter", "処理ごとの呼び出し回数", counts)
+    yield ("profilebot_operation_errors_total", "counter", "処理ごとのエラー回数", errors)
@@ -0,0 +1,272 @@
+import logging
+import asyncpg
+
+# 機能ごとの番号付きマイグレーション。
+# 各機能の適用済みの番号は schema_version テーブルに1行ずつ保存し、
+# 起動時はその1行を確認するだけで、未適用のものがあるときだけDDLを実行する。
+# schema_version がなかった頃のDBにもそのまま適用できるよう、各マイグレーションは
+# IF NOT EXISTS などで何度実行しても同じ結果になるように書く。
+
+async def _column_exists(connection, table, column):
+    return await connection.fetchval('''
+        SELECT EXISTS (
+            SELECT 1
+            FROM   information_schema.columns
+            WHERE  table_name = $1
+            AND    column_name = $2
+        );
+    ''', table, column)
+
+async def _daily_reminder_per_guild(connection):
+    await connection.execute('''
+        ALTER TABLE daily_reminder_log ADD COLUMN IF NOT EXISTS guild_id BIGINT;
+    ''')
+    # 旧形式（user_id だけが主キー）のテーブルは guild_id を追加して主キーを付け替える
+    if not await _column_exists(connection, 'reminder_recipients', 'guild_id'):
+        await connection.execute('''
+            ALTER TABLE reminder_recipients ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0;
+            ALTER TABLE reminder_recipients DROP CONSTRAINT IF EXISTS reminder_recipients_pkey;
+            ALTER TABLE reminder_recipients ADD PRIMARY KEY (guild_id, user_id);
+        ''')
+
+async def _report_cooldown_buckets(connection):
+    # 旧形式（user_id ごとの最終報告時刻だけ）のテーブルはカラムを追加して主キーを付け替える
+    if not await _column_exists(connection, 'report_cooldowns', 'guild_id'):
+        await connection.execute('''
+            ALTER TABLE report_cooldowns
+                ADD COLUMN guild_id BIGINT NOT NULL DEFAULT 0,
+                ADD COLUMN rule TEXT NOT NULL DEFAULT 'report',
+                ADD COLUMN tokens DOUBLE PRECISION NOT NULL DEFAULT 0,
+                ADD COLUMN expires_at TIMESTAMP WITH TIME ZONE;
+            ALTER TABLE report_cooldowns DROP CONSTRAINT IF EXISTS report_cooldowns_pkey;
+            ALTER TABLE report_cooldowns ADD PRIMARY KEY (user_id, guild_id, rule);
+        ''')
+
+MIGRATIONS = {
+    # BUMPくん
+    "bump": [
+        (1, "BUMP数・リマインダー・設定テーブルの作成", '''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                bump_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS reminders (
+                id SERIAL PRIMARY KEY,
+                channel_id BIGINT NOT NULL,
+                remind_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                status TEXT NOT NULL DEFAULT 'waiting'
+            );
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            INSERT INTO settings (key, value) VALUES ('scan_completed', 'false')
+            ON CONFLICT (key) DO NOTHING;
+        '''),
+    ],
+    # 自己紹介Bot
+    "intro_bot": [
+        (1, "自己紹介テーブルと設定テーブル（BUMPくんと共用）の作成", '''
+            CREATE TABLE IF NOT EXISTS introductions (
+                user_id BIGINT PRIMARY KEY,
+                channel_id BIGINT NOT NULL,
+                message_id BIGINT NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+            ALTER TABLE introductions
+                ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        '''),
+        # 自己紹介チャンネルに投稿されたメッセージの記録（編集・削除も残す）
+        # introductions は各ユーザーの現在の自己紹介を指し、削除されたら一つ前の自己紹介に戻す
+        (2, "自己紹介メッセージの履歴テーブルの作成", '''
+            CREATE TABLE IF NOT EXISTS introduction_messages (
+                message_id BIGINT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                channel_id BIGINT NOT NULL,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                edited_at TIMESTAMP WITH TIME ZONE,
+                deleted_at TIMESTAMP WITH TIME ZONE
+            );
+            CREATE INDEX IF NOT EXISTS idx_introduction_messages_user_live
+            ON introduction_messages (user_id, message_id DESC) WHERE deleted_at IS NULL;
+            INSERT INTO introduction_messages (message_id, user_id, channel_id, created_at)
+            SELECT message_id, user_id, channel_id, created_at FROM introductions
+            ON CONFLICT (message_id) DO NOTHING;
+        '''),
+        # 主キーのインデックスと同じ内容で、UPSERTのたびに余計な更新が発生していた
+        (3, "重複していた idx_introductions_user_id の削除", '''
+            DROP INDEX IF EXISTS idx_introductions_user_id;
+        '''),
+        # VC入室時に fetch_message を呼ばずに通知を組み立てるための本文・リンクのスナップショット
+        # （アイコンはゲートウェイから届くメンバーの現在のアバターを使うので保存しない）
+        (4, "自己紹介のスナップショット（本文・jump_url）の追加", '''
+            ALTER TABLE introductions
+                ADD COLUMN IF NOT EXISTS content TEXT,
+                ADD COLUMN IF NOT EXISTS jump_url TEXT;
+            ALTER TABLE introduction_messages
+                ADD COLUMN IF NOT EXISTS content TEXT,
+                ADD COLUMN IF NOT EXISTS jump_url TEXT;
+        '''),
+        # user_id だけが主キーだと、別のサーバーで自己紹介するとこのサーバーの自己紹介が上書きされていた。
+        # 自己紹介チャンネル（＝サーバー）ごとに1行にし、上書きで失われた分は履歴から復元する
+        (5, "自己紹介を自己紹介チャンネルごとに保存する", '''
+            ALTER TABLE introductions DROP CONSTRAINT IF EXISTS introductions_pkey;
+            ALTER TABLE introductions ADD PRIMARY KEY (channel_id, user_id);
+            DROP INDEX IF EXISTS idx_introduction_messages_user_live;
+            CREATE INDEX IF NOT EXISTS idx_introduction_messages_channel_user_live
+            ON introduction_messages (channel_id, user_id, message_id DESC) WHERE deleted_at IS NULL;
+            INSERT INTO introductions (channel_id, user_id, message_id, created_at, content, jump_url)
+            SELECT DISTINCT ON (channel_id, user_id) channel_id, user_id, message_id, created_at, content, jump_url
+            FROM introduction_messages
+            WHERE deleted_at IS NULL
+            ORDER BY channel_id, user_id, message_id DESC
+            ON CONFLICT (channel_id, user_id) DO NOTHING;
+        '''),
+    ],
+    # 守護神ボット
+    "shugoshin": [
+        (1, "レポート・サーバー設定・クールダウンテーブルの作成", '''
+            CREATE TABLE IF NOT EXISTS reports (
+                report_id SERIAL PRIMARY KEY, guild_id BIGINT, message_id BIGINT,
+                target_user_id BIGINT, violated_rule TEXT, details TEXT,
+                message_link TEXT, urgency TEXT, status TEXT DEFAULT '未対応',
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS guild_settings (
+                guild_id BIGINT PRIMARY KEY,
+                report_channel_id BIGINT,
+                urgent_role_id BIGINT
+            );
+            CREATE TABLE IF NOT EXISTS report_cooldowns (
+                user_id BIGINT PRIMARY KEY,
+                last_report_at TIMESTAMP WITH TIME ZONE NOT NULL
+            );
+        '''),
+        (2, "クールダウンをサーバー・ルールごとのトークンバケット形式に変更", _report_cooldown_buckets),
+        # 一覧のキーセットページングと、ステータスごとの件数（集計クエリを不要にする）
+        (3, "レポートの絞り込み用インデックスとステータス件数テーブルの作成", '''
+            CREATE INDEX IF NOT EXISTS idx_reports_guild_status_id ON reports (guild_id, status, report_id DESC);
+            CREATE INDEX IF NOT EXISTS idx_reports_guild_id ON reports (guild_id, report_id DESC);
+            CREATE INDEX IF NOT EXISTS idx_reports_status_id ON reports (status, report_id DESC);
+            CREATE TABLE IF NOT EXISTS report_status_counts (
+                guild_id BIGINT NOT NULL,
+                status TEXT NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (guild_id, status)
+            );
+            LOCK TABLE reports IN SHARE MODE;
+            DELETE FROM report_status_counts;
+            INSERT INTO report_status_counts (guild_id, status, count)
+            SELECT COALESCE(guild_id, 0), status, COUNT(*)
+            FROM reports
+            WHERE status IS NOT NULL
+            GROUP BY COALESCE(guild_id, 0), status;
+        '''),
+    ],
+    # 日次リマインダー
+    "daily_reminder": [
+        (1, "送信ログテーブルの作成", '''
+            CREATE TABLE IF NOT EXISTS daily_reminder_log (
+                id SERIAL PRIMARY KEY,
+                reminder_date DATE NOT NULL DEFAULT CURRENT_DATE,
+                notified_users TEXT[],
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_daily_reminder_date ON daily_reminder_log(reminder_date);
+        '''),
+        # 送信ログには人数だけを残し、対象者は reminder_recipients で1人1行として管理する
+        (2, "対象者テーブルの作成", '''
+            ALTER TABLE daily_reminder_log ADD COLUMN IF NOT EXISTS notified_count INTEGER;
+            CREATE TABLE IF NOT EXISTS reminder_recipients (
+                user_id BIGINT PRIMARY KEY,
+                first_notified_on DATE NOT NULL,
+                last_notified_on DATE NOT NULL
+            );
+        '''),
+        # 定期ジョブの次回実行時刻（再起動をまたいで取りこぼしを検出するため）
+        (3, "定期ジョブテーブルの作成", '''
+            CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                name TEXT PRIMARY KEY,
+                next_run_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                last_run_at TIMESTAMP WITH TIME ZONE
+            );
+        '''),
+        # 複数サーバー対応: 送信ログと対象者はサーバーごとに管理する（既存の送信ログは guild_id が NULL）
+        (4, "送信ログと対象者をサーバーごとに分ける", _daily_reminder_per_guild),
+        # 複数プロセスで動かしても、サーバーごとのジョブを1プロセスだけが実行するため
+        (5, "ジョブの担当リーステーブルの作成", '''
+            CREATE TABLE IF NOT EXISTS job_leases (
+                name TEXT NOT NULL,
+                guild_id BIGINT NOT NULL,
+                holder TEXT NOT NULL,
+                expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                PRIMARY KEY (name, guild_id)
+            );
+        '''),
+    ],
+}
+
+# このプロセスで最新だと確認済みの機能（ゲートウェイ再接続時の on_ready ではDBも見ない）
+_up_to_date = set()
+
+def latest_version(component):
+    return MIGRATIONS[component][-1][0]
+
+async def _current_version(connection, component):
+    try:
+        return await connection.fetchval(
+            "SELECT version FROM schema_version WHERE component = $1", component
+        ) or 0
+    except asyncpg.UndefinedTableError:
+        return 0
+
+async def migrate(connection, component):
+    """
+    指定した機能の未適用のマイグレーションを番号順に適用する。
+    適用済みなら schema_version の1行を読むだけで終わる。適用したマイグレーションの数を返す。
+    複数のプロセスが同時に起動しても、アドバイザリロックで1プロセスずつ適用する。
+    """
+    if component in _up_to_date:
+        return 0
+    target = latest_version(component)
+    if await _current_version(connection, component) >= target:
+        _up_to_date.add(component)
+        return 0
+
+    applied = 0
+    async with connection.transaction():
+        await connection.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('schema_version:' || $1))", component
+        )
+        await connection.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                component TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+        # ロックを取るまでに他のプロセスが適用している場合があるので読み直す
+        current = await _current_version(connection, component)
+        for version, description, step in MIGRATIONS[component]:
+            if version <= current:
+                continue
+            logging.info(f"📝 マイグレーション {component} #{version}: {description}")
+            if callable(step):
+                await step(connection)
+            else:
+                await connection.execute(step)
+            applied += 1
+        if applied:
+            await connection.execute('''
+                INSERT INTO schema_version (component, version) VALUES ($1, $2)
+                ON CONFLICT (component) DO UPDATE SET
+                    version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP;
+            ''', component, target)
+    _up_to_date.add(component)
+    if applied:
+        logging.info(f"✅ {component} のマイグレーションを {applied}件適用しました (version {target})")
+    return applied
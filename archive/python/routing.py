@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+
+class GuildRoute:
+    """
+    1つのサーバーの自己紹介チャンネル・通知チャンネル・監視VC・除外ユーザーの設定。
+    VCと除外ユーザーは frozenset で持ち、イベントごとの判定を定数時間で行う。
+    """
+
+    __slots__ = ("guild_id", "intro_channel_id", "notify_channel_id", "voice_channel_ids", "excluded_user_ids")
+
+    def __init__(self, guild_id, intro_channel_id, notify_channel_id, voice_channel_ids, excluded_user_ids=()):
+        self.guild_id = guild_id
+        self.intro_channel_id = intro_channel_id
+        self.notify_channel_id = notify_channel_id
+        self.voice_channel_ids = frozenset(voice_channel_ids)
+        self.excluded_user_ids = frozenset(excluded_user_ids)
+
+    def with_guild_id(self, guild_id):
+        return GuildRoute(guild_id, self.intro_channel_id, self.notify_channel_id,
+                          self.voice_channel_ids, self.excluded_user_ids)
+
+class RoutingTable:
+    """
+    サーバーID・自己紹介チャンネルID・VCチャンネルIDから GuildRoute を引くための辞書の組。
+    読み込み後は変更せず、再読み込み時は新しいテーブルに丸ごと差し替える。
+    """
+
+    def __init__(self, routes):
+        self.routes = tuple(routes)
+        self.by_guild = {r.guild_id: r for r in self.routes if r.guild_id}
+        self.by_intro_channel = {r.intro_channel_id: r for r in self.routes}
+        self.by_voice_channel = {c: r for r in self.routes for c in r.voice_channel_ids}
+
+    def for_guild(self, guild_id):
+        return self.by_guild.get(guild_id)
+
+    def for_intro_channel(self, channel_id):
+        return self.by_intro_channel.get(channel_id)
+
+    def for_voice_channel(self, channel_id):
+        return self.by_voice_channel.get(channel_id)
+
+    def resolve_guild_ids(self, get_channel):
+        """
+        サーバーIDが未設定のルートについて、自己紹介チャンネルの所属サーバーから補完したテーブルを返す。
+        """
+        routes = []
+        for route in self.routes:
+            if not route.guild_id:
+                channel = get_channel(route.intro_channel_id)
+                if channel is not None:
+                    route = route.with_guild_id(channel.guild.id)
+            routes.append(route)
+        return RoutingTable(routes)
+
+def _parse_ids(value):
+    return [int(v) for v in str(value).split(",") if v.strip()]
+
+def _route_from_dict(entry):
+    return GuildRoute(
+        guild_id=int(entry["guild_id"]) if entry.get("guild_id") else None,
+        intro_channel_id=int(entry["introduction_channel_id"]),
+        notify_channel_id=int(entry["notification_channel_id"]),
+        voice_channel_ids=[int(c) for c in entry.get("target_voice_channels", [])],
+        excluded_user_ids=[int(u) for u in entry.get("excluded_user_ids", [])],
+    )
+
+def load_routing(path, default_route):
+    """
+    ルーティング設定を読み込む。
+    path のJSONファイルがあればその "guilds" 配列から、なければ default_route だけのテーブルを作る。
+    JSONの各要素は guild_id, introduction_channel_id, notification_channel_id,
+    target_voice_channels, excluded_user_ids を持つ。
+    """
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        routes = [_route_from_dict(entry) for entry in config.get("guilds", [])]
+        logging.info(f"🧭 ルーティング設定を読み込みました: {path} ({len(routes)}サーバー)")
+        return RoutingTable(routes)
+    return RoutingTable([default_route])
+
+class RoutingConfigWatcher:
+    """
+    ルーティング設定ファイルの更新時刻を見て、変更されていれば読み込み直す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = self._current_mtime()
+
+    def _current_mtime(self):
+        try:
+            return os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            return None
+
+    def changed(self):
+        mtime = self._current_mtime()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            return True
+        return False
+
+def default_route_from_env(intro_channel_id, notify_channel_id, voice_channel_ids, excluded_user_ids):
+    """
+    環境変数（GUILD_ID, INTRODUCTION_CHANNEL_ID, NOTIFICATION_CHANNEL_ID,
+    TARGET_VOICE_CHANNELS, EXCLUDED_USER_IDS）で上書きできる既定のルートを作る。
+    """
+    guild_id = os.getenv("GUILD_ID")
+    return GuildRoute(
+        guild_id=int(guild_id) if guild_id else None,
+        intro_channel_id=int(os.getenv("INTRODUCTION_CHANNEL_ID", intro_channel_id)),
+        notify_channel_id=int(os.getenv("NOTIFICATION_CHANNEL_ID", notify_channel_id)),
+        voice_channel_ids=_parse_ids(os.getenv("TARGET_VOICE_CHANNELS", "")) or voice_channel_ids,
+        excluded_user_ids=_parse_ids(os.getenv("EXCLUDED_USER_IDS", "")) or excluded_user_ids,
+    )
@@ -0,0 +1,152 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import database as db
+
+# 長時間眠る場合も、この秒数ごとに起きて壁時計を確認し直す（時計の補正・サスペンド対策）
+MAX_SLEEP_SECONDS = 300
+
+def daily_at(hour, minute, tz):
+    """
+    毎日 tz の hour:minute に実行するための次回実行時刻の計算関数を返す。
+    """
+    def next_run_after(now):
+        local_now = now.astimezone(tz)
+        candidate = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= local_now:
+            candidate = (local_now + datetime.timedelta(days=1)).replace(
+                hour=hour, minute=minute, second=0, microsecond=0
+            )
+        return candidate
+    return next_run_after
+
+def every(seconds):
+    """
+    seconds 秒ごとに実行するための次回実行時刻の計算関数を返す。
+    """
+    def next_run_after(now):
+        return now + datetime.timedelta(seconds=seconds)
+    return next_run_after
+
+class _Job:
+    __slots__ = ("name", "func", "next_run_after", "persist", "retry_delay", "next_run")
+
+    def __init__(self, name, func, next_run_after, persist, retry_delay):
+        self.name = name
+        self.func = func
+        self.next_run_after = next_run_after
+        self.persist = persist
+        self.retry_delay = retry_delay
+        self.next_run = None
+
+class Scheduler:
+    """
+    複数の定期ジョブを1つのタスクとヒープで管理するスケジューラー。
+    persist=True のジョブは次回実行時刻をDBに保存し、停止中に実行時刻を過ぎていた場合は
+    起動後すぐに取りこぼし分を実行する。
+    start() は何度呼んでもタスクを1つしか作らない（再接続時の on_ready 対策）。
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._task = None
+        self._wakeup = None
+
+    def add_job(self, name, func, next_run_after, persist=False, retry_delay=None):
+        """
+        ジョブを登録する。func は引数なしのコルーチン関数。
+        失敗時は retry_delay 秒後（次回の通常実行より前なら）に再実行する。
+        """
+        self._jobs[name] = _Job(name, func, next_run_after, persist, retry_delay)
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._heap = []
+        now = _utcnow()
+        for job in self._jobs.values():
+            next_run = None
+            if job.persist:
+                next_run = await db.get_job_next_run(job.name)
+                if next_run and next_run <= now:
+                    logging.info(f"⏰ ジョブ '{job.name}' の実行予定 ({next_run}) を過ぎているため、すぐに実行します")
+            if next_run is None:
+                next_run = job.next_run_after(now)
+                if job.persist:
+                    await db.set_job_next_run(job.name, next_run)
+            self._schedule(job, next_run)
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def next_runs(self):
+        return {name: job.next_run for name, job in self._jobs.items()}
+
+    def _schedule(self, job, next_run):
+        job.next_run = next_run
+        heapq.heappush(self._heap, (next_run, next(self._counter), job))
+        if self._wakeup:
+            self._wakeup.set()
+        if job.persist:
+            logging.info(f"⏰ 次回 '{job.name}' 実行: {next_run}")
+        else:
+            logging.debug("⏰ 次回 '%s' 実行: %s", job.name, next_run)
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            next_run, _, job = self._heap[0]
+            if job.next_run != next_run:
+                # 再スケジュールされて古くなったエントリ
+                heapq.heappop(self._heap)
+                continue
+
+            delay = (next_run - _utcnow()).total_seconds()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, MAX_SLEEP_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            asyncio.create_task(self._fire(job))
+
+    async def _fire(self, job):
+        next_run = job.next_run_after(_utcnow())
+        job.next_run = None
+        try:
+            # 実行前に次回時刻を保存しておき、実行中に落ちても同じ回を二重に実行しないようにする
+            if job.persist:
+                await db.set_job_next_run(job.name, next_run, last_run_at=_utcnow())
+            await job.func()
+        except Exception as e:
+            logging.error(f"❌ ジョブ '{job.name}' の実行中にエラー: {e}", exc_info=True)
+            if job.retry_delay:
+                retry_at = _utcnow() + datetime.timedelta(seconds=job.retry_delay)
+                if retry_at < next_run:
+                    next_run = retry_at
+                    if job.persist:
+                        await _persist_quietly(job.name, next_run)
+        self._schedule(job, next_run)
+
+async def _persist_quietly(name, next_run):
+    try:
+        await db.set_job_next_run(name, next_run)
+    except Exception as e:
+        logging.error(f"❌ ジョブ '{name}' の次回実行時刻の保存に失敗しました: {e}")
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
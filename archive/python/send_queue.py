@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from metrics import measure
+
+# 1メッセージに付けられる埋め込みの上限と本文の文字数上限（Discordの仕様）
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_CONTENT_LENGTH = 2000
+
+class _Outgoing:
+    __slots__ = ("content", "embed", "view", "mergeable", "future", "enqueued_at")
+
+    def __init__(self, content, embed, view, mergeable, future):
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.mergeable = mergeable
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+class ChannelSendQueue:
+    """
+    1つのチャンネルへの送信を受け持つキュー。
+    イベントハンドラは enqueue して即座に戻り、送信は単一のコンシューマータスクが
+    トークンバケットでチャンネルごとのレート制限を守りながら順番に行う。
+    待ちが発生している間に溜まった入室通知（mergeable）は、
+    埋め込み最大10件までを1メッセージにまとめて送る。
+    """
+
+    def __init__(self, channel, rate=5, per_seconds=5.0):
+        self.channel = channel
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._capacity = rate
+        self._tokens = float(rate)
+        self._refill_per_second = rate / per_seconds
+        self._last_refill = time.monotonic()
+        self.sent_messages = 0
+        self.sent_items = 0
+        self.merged_items = 0
+        self.failed_items = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    def enqueue(self, content=None, *, embed=None, view=None, mergeable=False):
+        """
+        送信を予約する。送信結果（成功なら True）を受け取る Future を返す。
+        待つ必要がなければ戻り値は無視してよい。
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Outgoing(content, embed, view, mergeable, future))
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._consume())
+        return future
+
+    async def _consume(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._acquire_token()
+            batch = self._take_batch()
+            await self._send(batch)
+
+    async def _acquire_token(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._refill_per_second)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._refill_per_second)
+
+    def _take_batch(self):
+        first = self._pending.popleft()
+        batch = [first]
+        if not first.mergeable:
+            return batch
+
+        embed_count = 1 if first.embed else 0
+        content_length = len(first.content or "")
+        while self._pending and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            candidate = self._pending[0]
+            if not candidate.mergeable:
+                break
+            next_embeds = embed_count + (1 if candidate.embed else 0)
+            next_length = content_length + 1 + len(candidate.content or "")
+            if next_embeds > MAX_EMBEDS_PER_MESSAGE or next_length > MAX_CONTENT_LENGTH:
+                break
+            batch.append(self._pending.popleft())
+            embed_count = next_embeds
+            content_length = next_length
+        return batch
+
+    async def _send(self, batch):
+        try:
+            with measure("discord.send"):
+                await self._deliver(batch)
+        except Exception as e:
+            self.failed_items += len(batch)
+            logging.error(f"❌ チャンネル(ID: {self.channel.id})への送信に失敗しました: {e}", exc_info=True)
+            self._resolve(batch, False)
+            return
+
+        self.sent_messages += 1
+        self.sent_items += len(batch)
+        self._resolve(batch, True)
+
+    async def _deliver(self, batch):
+        if len(batch) == 1:
+            item = batch[0]
+            kwargs = {}
+            if item.embed:
+                kwargs["embed"] = item.embed
+            if item.view:
+                kwargs["view"] = item.view
+            await self.channel.send(item.content, **kwargs)
+        else:
+            # まとめて送る場合、リンクボタンは付けない（各埋め込みの作者欄から元の投稿へ移動できる）
+            content = "\n".join(item.content for item in batch if item.content)
+            embeds = [item.embed for item in batch if item.embed]
+            await self.channel.send(content, embeds=embeds)
+            self.merged_items += len(batch) - 1
+
+    def _resolve(self, batch, ok):
+        now = time.monotonic()
+        for item in batch:
+            latency = now - item.enqueued_at
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self._total_latency += latency
+            if not item.future.done():
+                item.future.set_result(ok)
+
+    def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        for item in self._pending:
+            if not item.future.done():
+                item.future.set_result(False)
+        self._pending.clear()
+
+    def stats(self):
+        completed = self.sent_items + self.failed_items
+        return {
+            "depth": len(self._pending),
+            "sent_messages": self.sent_messages,
+            "sent_items": self.sent_items,
+            "merged_items": self.merged_items,
+            "failed_items": self.failed_items,
+            "last_latency_seconds": self.last_latency,
+            "max_latency_seconds": self.max_latency,
+            "avg_latency_seconds": self._total_latency / completed if completed else 0.0,
+        }
+
+_queues = {}
+
+def get_send_queue(channel):
+    """
+    チャンネルに対応する送信キューを取得する（なければ作成する）。
+    """
+    queue = _queues.get(channel.id)
+    if queue is None:
+        queue = ChannelSendQueue(channel)
+        _queues[channel.id] = queue
+    else:
+        queue.channel = channel
+    return queue
+
+def all_send_queues():
+    return dict(_queues)
+
+def close_send_queues():
+    for queue in _queues.values():
+        queue.close()
+    _queues.clear()
@@ -0,0 +1,55 @@
+import heapq
+import time
+
+class JoinDebouncer:
+    """
+    サーバー・メンバーごとにVC入室通知の間隔を空けるためのクールダウン管理。
+    通知してから cooldown_seconds の間は同じサーバーでの同じメンバーの入室通知を抑制する
+    （別のサーバーのVCへの入室は抑制しない）。
+    期限切れのエントリはヒープで期限順に取り出して掃除する。
+    """
+
+    def __init__(self, cooldown_seconds):
+        self.cooldown_seconds = cooldown_seconds
+        self._until = {}
+        self._expiry_heap = []
+        self.allowed = 0
+        self.dropped = 0
+
+    def should_notify(self, guild_id, member_id, now=None):
+        """
+        通知してよければ True を返し、クールダウンを開始する。
+        クールダウン中なら False を返し、抑制件数を数える。
+        """
+        if self.cooldown_seconds <= 0:
+            self.allowed += 1
+            return True
+
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+
+        key = (guild_id, member_id)
+        until = self._until.get(key)
+        if until is not None and until > now:
+            self.dropped += 1
+            return False
+
+        expires_at = now + self.cooldown_seconds
+        self._until[key] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, key))
+        self.allowed += 1
+        return True
+
+    def _expire(self, now):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, member_id = heapq.heappop(heap)
+            if self._until.get(member_id) == expires_at:
+                del self._until[member_id]
+
+    def stats(self):
+        return {
+            "tracked": len(self._until),
+            "allowed": self.allowed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+class WriteBehindState:
+    """
+    読み書きはメモリ上で行い、DBへは flush でまとめて書き込む（ライトビハインド）状態の共通部分。
+    初回の使用時に一度だけ load し、flush_delay_seconds を指定すると変更からその秒数後に自動で flush する。
+    書き込みに失敗した分は次回の flush に持ち越す。
+
+    サブクラスは次のメソッドを実装する。
+      load()                    : DBから読み込み、loaded を True にする
+      _take_pending()           : 未反映の変更を取り出して返す（なければ空のコレクション）
+      _restore_pending(pending) : 書き込みに失敗した変更を戻す
+      _write(pending)           : 変更をDBへ書き込み、書き込んだ件数を返す
+    """
+
+    # ログに出す状態の名前
+    label = "状態"
+
+    def __init__(self, flush_delay_seconds=None):
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        self.flush_delay_seconds = flush_delay_seconds
+        self._flush_task = None
+        self.flushed_batches = 0
+        self.flush_failures = 0
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load()
+
+    async def flush(self):
+        """
+        未反映の変更を1回の書き込みでDBへ反映し、書き込んだ件数を返す。失敗した分は次回に持ち越す。
+        """
+        pending = self._take_pending()
+        if not pending:
+            return 0
+        try:
+            written = await self._write(pending)
+        except Exception as e:
+            self._restore_pending(pending)
+            self.flush_failures += 1
+            logging.error(f"❌ {self.label}の書き込み中にエラー（{len(pending)}件は次回に持ち越し）: {e}")
+            raise
+        self.flushed_batches += 1
+        logging.debug("💾 %sを書き込みました (%s件)", self.label, written)
+        return written
+
+    def _schedule_flush(self):
+        """
+        変更があったときに呼ぶ。flush_delay_seconds 後の flush がまだ予約されていなければ予約する。
+        """
+        if self.flush_delay_seconds is None or (self._flush_task and not self._flush_task.done()):
+            return
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay_seconds)
+        try:
+            await self.flush()
+        except Exception:
+            pass  # flush がエラーを記録し、未反映分を持ち越している